@@ -0,0 +1,961 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local benchmarks, no camera or network needed.
+
+    python3 benchmark.py frames --width 1920 --height 1080 --frames 300 --format NV12
+    python3 benchmark.py push --width 1920 --height 1080 --frames 300
+    python3 benchmark.py fanout --clients 4 --duration 10
+    python3 benchmark.py ring --frames 100000
+    python3 benchmark.py e2e --duration 20
+    python3 benchmark.py scale --streams 1 2 4 8
+    python3 benchmark.py scale --hook benchmark:identity --pixel_format I420 --buffer_mb 16
+    python3 benchmark.py reconnect --cycles 3 --down 5
+    python3 benchmark.py ttff --joins 20
+    python3 benchmark.py sample --duration 10
+    python3 benchmark.py encoders --frames 300
+    python3 benchmark.py gate --frames 900 --motion 0.1
+    python3 benchmark.py mosaic --tiles 9 --dead 1
+    python3 benchmark.py multicast --clients 1 2 4 8
+
+e2e starts local_rtsp_source.py with burnt in timestamps and each server
+variant as subprocesses on localhost, attaches clients and reports fps,
+p50/p99 glass-to-glass latency, server CPU per stream and server RSS.
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstRtspServer', '1.0')
+from gi.repository import Gst, GstRtspServer, GObject
+
+from gst_frame import (COPY_MODES, PIXEL_FORMATS, ChangeGate, FrameMeta, FramePool, PushBufferPool, SourceClock,
+                       sample_to_array)
+from frame_buffer import FrameHub, FrameRing
+from encoders import available_encoders, ENCODERS
+from local_rtsp_source import read_stamp, stamp_age, start_test_source
+
+
+def start_main_loop():
+    loop = GObject.MainLoop()
+    threading.Thread(target=loop.run, daemon=True).start()
+    return loop
+
+
+def serve_factory(factory, port, stream_uri='/stream'):
+    server = GstRtspServer.RTSPServer()
+    server.set_address('127.0.0.1')
+    server.set_service(str(port))
+    server.get_mount_points().add_factory(stream_uri, factory)
+    server.attach(None)
+    return server
+
+
+class FrameCounter:
+    """RTSP client that decodes a stream and counts frames."""
+    def __init__(self, url, source_options=''):
+        self.frames = 0
+        self.pipe = Gst.parse_launch(
+            f'rtspsrc location={url} latency=0 {source_options} ! rtph264depay ! h264parse ! avdec_h264 '
+            '! fakesink name=sink sync=false signal-handoffs=true')
+        self.pipe.get_by_name('sink').connect('handoff', self.on_handoff)
+        self.pipe.set_state(Gst.State.PLAYING)
+
+    def on_handoff(self, sink, buf, pad):
+        self.frames += 1
+
+    def stop(self):
+        self.pipe.set_state(Gst.State.NULL)
+
+
+def bench_frames(opt):
+    """Time and Python heap bytes per frame for each Video_Buffer copy mode.
+
+    tracemalloc only sees the Python heap (NumPy arrays, bytes), not the
+    GstBuffers and GLib allocations behind the samples. "py / frame" is
+    those bytes in units of one frame, 1.0 is one full copy.
+    """
+    bytes_per_pixel = {'BGR': 3, 'GRAY8': 1, 'NV12': 1.5, 'I420': 1.5}[opt.format]
+    frame_bytes = opt.width * opt.height * bytes_per_pixel
+    print(f"{'mode':<6} {'us/frame':>10} {'py MB/frame':>15} {'py / frame':>13} {'pool copies':>12}")
+
+    for mode in COPY_MODES:
+        pipe = Gst.parse_launch(
+            f'videotestsrc num-buffers={opt.frames} pattern=ball '
+            f'! video/x-raw,format={opt.format},width={opt.width},height={opt.height} '
+            '! appsink name=sink sync=false max-buffers=1')
+        sink = pipe.get_by_name('sink')
+        pool = FramePool(4) if mode == 'pool' else None
+        pipe.set_state(Gst.State.PLAYING)
+
+        frames = 0
+        elapsed = 0.0
+        allocated = 0
+        tracemalloc.start()
+        while True:
+            sample = sink.emit('pull-sample')
+            if sample is None:
+                break
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            # dropped right away, the peak still counts what it allocated
+            sample_to_array(sample, mode, pool)
+            elapsed += time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            allocated += peak - before
+            frames += 1
+        tracemalloc.stop()
+        pipe.set_state(Gst.State.NULL)
+
+        frames = max(frames, 1)
+        print(f"{mode:<6} {elapsed / frames * 1e6:>10.1f} "
+              f"{allocated / frames / 1e6:>15.2f} "
+              f"{allocated / frames / frame_bytes:>13.2f} "
+              f"{pool.copies if pool else '-':>12}")
+
+
+def bench_push(opt):
+    """CPU time per appsrc buffer: tostring + fill vs PushBufferPool."""
+    frame = np.random.randint(0, 255, (opt.height, opt.width, 3), dtype=np.uint8)
+
+    def legacy(frame):
+        data = frame.tobytes()
+        buf = Gst.Buffer.new_allocate(None, len(data), None)
+        buf.fill(0, data)
+        return buf
+
+    buffer_pool = PushBufferPool()
+    print(f"{'path':<8} {'us/frame':>10} {'cpu us/frame':>13} {'fps/core':>10}")
+    for name, push in (('legacy', legacy), ('pool', buffer_pool.frame_to_buffer)):
+        push(frame)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        for _ in range(opt.frames):
+            buf = push(frame)
+            del buf
+        wall = (time.perf_counter() - wall) / opt.frames
+        cpu = (time.process_time() - cpu) / opt.frames
+        print(f"{name:<8} {wall * 1e6:>10.1f} {cpu * 1e6:>13.1f} {1 / max(cpu, 1e-9):>10.1f}")
+    buffer_pool.stop()
+
+
+def bench_fanout(opt):
+    """Several clients on one hub-fed mount, each must get the full frame rate."""
+    import gst_rtsp_server
+
+    loop = start_main_loop()
+    start_test_source(opt.source_port, '/test', fps=opt.fps)
+
+    frame_hub = FrameHub(capacity=30)
+    factory = gst_rtsp_server.SensorFactory(frame_hub)
+    # one media per client, the case that used to split a shared queue
+    factory.set_shared(opt.shared)
+    serve_factory(factory, opt.port)
+
+    video_buffer = gst_rtsp_server.Video_Buffer(pipe=f'rtsp://127.0.0.1:{opt.source_port}/test')
+    video_buffer.add_frame_callback(frame_hub.publish)
+
+    clients = [FrameCounter(f'rtsp://127.0.0.1:{opt.port}/stream') for _ in range(opt.clients)]
+    time.sleep(opt.warmup)
+    start = [client.frames for client in clients]
+    time.sleep(opt.duration)
+
+    failed = False
+    for i, client in enumerate(clients):
+        fps = (client.frames - start[i]) / opt.duration
+        ok = fps >= opt.min_ratio * opt.fps
+        failed |= not ok
+        print(f"client {i}: {fps:6.1f} fps {'ok' if ok else 'LOW'}")
+
+    for client in clients:
+        client.stop()
+    video_buffer.release()
+    loop.quit()
+    if failed:
+        sys.exit(1)
+
+
+def bench_ring(opt):
+    """queue.Queue qsize/get_nowait/put dance vs FrameRing, one producer and one consumer."""
+    max_queue_size = 30
+
+    def legacy_put(frame_queue, frame):
+        if frame_queue.qsize() >= max_queue_size:
+            try:
+                frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+        frame_queue.put(frame)
+
+    print(f"{'size':<6} {'buffer':<7} {'put us':>8} {'get us':>8} {'delivered':>10} {'dropped':>9}")
+    for name, shape in (('1080p', (1080, 1920, 3)), ('4K', (2160, 3840, 3))):
+        frames = [np.zeros(shape, dtype=np.uint8) for _ in range(4)]
+        for kind in ('queue', 'ring'):
+            if kind == 'queue':
+                buffer = queue.Queue(maxsize=max_queue_size)
+                put = lambda frame: legacy_put(buffer, frame)
+            else:
+                buffer = FrameRing(capacity=max_queue_size)
+                put = buffer.put
+
+            done = threading.Event()
+            stats = {'delivered': 0, 'get': 0.0}
+
+            def consume():
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        buffer.get(timeout=0.05)
+                    except queue.Empty:
+                        if done.is_set():
+                            return
+                        continue
+                    stats['get'] += time.perf_counter() - start
+                    stats['delivered'] += 1
+
+            consumer = threading.Thread(target=consume)
+            consumer.start()
+            start = time.perf_counter()
+            for i in range(opt.frames):
+                put(frames[i % len(frames)])
+            put_time = time.perf_counter() - start
+            done.set()
+            consumer.join()
+
+            delivered = stats['delivered']
+            print(f"{name:<6} {kind:<7} {put_time / opt.frames * 1e6:>8.2f} "
+                  f"{stats['get'] / max(delivered, 1) * 1e6:>8.2f} "
+                  f"{delivered:>10} {opt.frames - delivered:>9}")
+
+
+# server variants for the e2e suite, {source} is the local stamped source
+SERVER_VARIANTS = {
+    'gst-native': ['gst_rtsp_server.py', '--rtsp_source', '{source}', '--rotate', '0'],
+    'gst-hook': ['gst_rtsp_server.py', '--rtsp_source', '{source}', '--rotate', '0',
+                 '--hook', 'benchmark:identity'],
+    'gst-passthrough': ['gst_rtsp_server.py', '--rtsp_source', '{source}', '--passthrough'],
+    'cv': ['cv_rtsp_server.py', '--rtsp_source', '{source}'],
+}
+
+
+def identity(frame):
+    """Per-frame hook for the gst-hook variant, forces the Python appsrc path."""
+    return frame
+
+
+class ProcessStats:
+    """CPU seconds and RSS of a process from /proc."""
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK')
+
+    def cpu_seconds(self):
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime and stime, fields 14 and 15 counting from 1
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_mb(self):
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(int(len(values) * q / 100), len(values) - 1)]
+
+
+class StampReader:
+    """Collects glass-to-glass latency of stamped frames."""
+    def __init__(self):
+        self.frames = 0
+        self.latencies = []
+        self.recording = False
+
+    def on_frame(self, frame):
+        if not self.recording:
+            return
+        counter, timestamp = read_stamp(frame)
+        self.frames += 1
+        self.latencies.append(stamp_age(timestamp))
+
+
+def gst_stamp_client(url, reader):
+    """gst_client.Video_Buffer that reads the stamp of every new sample."""
+    from gst_client import Video_Buffer
+
+    class StampClient(Video_Buffer):
+        def callback(self, sink):
+            result = super(StampClient, self).callback(sink)
+            reader.on_frame(self._frame)
+            return result
+
+    client = StampClient(pipe=url.replace('rtsp://', ''), copy_mode='view')
+    return client.stop
+
+
+def cv_stamp_client(url, reader):
+    import cv2
+
+    cap = cv2.VideoCapture(url)
+    running = [True]
+
+    def read_loop():
+        while running[0]:
+            ret, frame = cap.read()
+            if ret:
+                reader.on_frame(frame)
+        cap.release()
+
+    threading.Thread(target=read_loop, daemon=True).start()
+
+    def stop():
+        running[0] = False
+    return stop
+
+
+def bench_e2e(opt):
+    """Headless fps / latency / CPU / memory for every server variant."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    source_url = f'rtsp://127.0.0.1:{opt.source_port}/test'
+    relay_url = f'rtsp://127.0.0.1:{opt.port}/stream'
+    loop = start_main_loop()
+
+    source = subprocess.Popen(
+        [sys.executable, os.path.join(here, 'local_rtsp_source.py'), '--burn_timestamp',
+         '--port', str(opt.source_port), '--width', str(opt.width), '--height', str(opt.height),
+         '--fps', str(opt.fps)],
+        cwd=here, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+
+    print(f"{'variant':<16} {'client':<6} {'fps':>6} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'cpu %/stream':>13} {'rss MB':>8}")
+    results = {}
+    try:
+        for variant in opt.variants:
+            command = [arg.format(source=source_url) for arg in SERVER_VARIANTS[variant]]
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(here, command[0])] + command[1:] +
+                ['--address', '127.0.0.1', '--port', str(opt.port)],
+                cwd=here, stdout=subprocess.DEVNULL)
+            stats = ProcessStats(server.pid)
+            time.sleep(2)
+
+            readers = [StampReader() for _ in range(opt.clients)]
+            connect = cv_stamp_client if opt.client == 'cv2' else gst_stamp_client
+            stops = [connect(relay_url, reader) for reader in readers]
+            time.sleep(opt.warmup)
+
+            for reader in readers:
+                reader.recording = True
+            cpu = stats.cpu_seconds()
+            time.sleep(opt.duration)
+            cpu = stats.cpu_seconds() - cpu
+            rss = stats.rss_mb()
+            for reader in readers:
+                reader.recording = False
+
+            for stop in stops:
+                stop()
+            server.terminate()
+            server.wait()
+
+            latencies = [latency for reader in readers for latency in reader.latencies]
+            fps = sum(reader.frames for reader in readers) / opt.duration / opt.clients
+            results[variant] = (fps, percentile(latencies, 50), percentile(latencies, 99),
+                                cpu / opt.duration * 100, rss)
+            print(f"{variant:<16} {opt.client:<6} {fps:>6.1f} "
+                  f"{results[variant][1] * 1000:>8.1f} {results[variant][2] * 1000:>8.1f} "
+                  f"{results[variant][3]:>13.1f} {rss:>8.1f}")
+    finally:
+        source.terminate()
+        source.wait()
+        loop.quit()
+
+    failed = [variant for variant, result in results.items() if result[0] < opt.min_ratio * opt.fps]
+    if failed:
+        print(f"below {opt.min_ratio * opt.fps:.1f} fps: {', '.join(failed)}")
+        sys.exit(1)
+    return results
+
+
+def bench_scale(opt):
+    """Relay CPU and memory per stream with N local sources in one gst_rtsp_server.py."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    loop = start_main_loop()
+
+    print(f"{'streams':>7} {'fps/stream':>11} {'cpu %/stream':>13} {'rss MB':>8} {'MB/stream':>10}")
+    for count in opt.streams:
+        source = subprocess.Popen(
+            [sys.executable, os.path.join(here, 'local_rtsp_source.py'), '--port', str(opt.source_port),
+             '--count', str(count), '--width', str(opt.width), '--height', str(opt.height),
+             '--fps', str(opt.fps), '--stream_uri', '/test'],
+            cwd=here, stdout=subprocess.DEVNULL)
+        sources = [f'rtsp://127.0.0.1:{opt.source_port}/test' + (str(i) if count > 1 else '')
+                   for i in range(count)]
+        streams = [dict(mount=f'/stream{i}', source=url, passthrough=opt.passthrough, hook=opt.hook,
+                        pixel_format=opt.pixel_format, buffer_mb=opt.buffer_mb, buffer_latency=opt.buffer_latency)
+                   for i, url in enumerate(sources)]
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as config:
+            json.dump(streams, config)
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(here, 'gst_rtsp_server.py'), '--config', config.name,
+             '--address', '127.0.0.1', '--port', str(opt.port)],
+            cwd=here, stdout=subprocess.DEVNULL)
+        stats = ProcessStats(server.pid)
+        time.sleep(2)
+
+        clients = [FrameCounter(f'rtsp://127.0.0.1:{opt.port}{stream["mount"]}') for stream in streams]
+        time.sleep(opt.warmup)
+        frames = [client.frames for client in clients]
+        cpu = stats.cpu_seconds()
+        time.sleep(opt.duration)
+        cpu = stats.cpu_seconds() - cpu
+        fps = sum(client.frames - start for client, start in zip(clients, frames)) / opt.duration / count
+        rss = stats.rss_mb()
+
+        for client in clients:
+            client.stop()
+        server.terminate()
+        server.wait()
+        source.terminate()
+        source.wait()
+        os.unlink(config.name)
+
+        print(f"{count:>7} {fps:>11.1f} {cpu / opt.duration * 100 / count:>13.1f} "
+              f"{rss:>8.1f} {rss / count:>10.1f}")
+    loop.quit()
+
+
+# join variants for the ttff suite, extra gst_rtsp_server.py arguments
+JOIN_VARIANTS = {
+    'shared': [],
+    'force-keyframe': ['--force_keyframe'],
+    'gop-cache': ['--gop_cache'],
+}
+
+
+def first_frame_time(url, timeout):
+    """Seconds from starting an RTSP client to its first decoded frame, None on timeout."""
+    decoded = threading.Event()
+    pipe = Gst.parse_launch(
+        f'rtspsrc location={url} latency=0 ! rtph264depay ! h264parse ! avdec_h264 '
+        '! fakesink name=sink sync=false signal-handoffs=true')
+    pipe.get_by_name('sink').connect('handoff', lambda sink, buf, pad: decoded.set())
+    start = time.monotonic()
+    pipe.set_state(Gst.State.PLAYING)
+    ok = decoded.wait(timeout)
+    elapsed = time.monotonic() - start
+    pipe.set_state(Gst.State.NULL)
+    return elapsed if ok else None
+
+
+def bench_ttff(opt):
+    """Time to first decoded frame for clients joining a stream that is already playing."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    source_url = f'rtsp://127.0.0.1:{opt.source_port}/test'
+    relay_url = f'rtsp://127.0.0.1:{opt.port}/stream'
+    loop = start_main_loop()
+
+    source = subprocess.Popen(
+        [sys.executable, os.path.join(here, 'local_rtsp_source.py'), '--port', str(opt.source_port),
+         '--width', str(opt.width), '--height', str(opt.height), '--fps', str(opt.fps)],
+        cwd=here, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+
+    print(f"{'variant':<16} {'joins':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'timeouts':>9}")
+    try:
+        for variant in opt.variants:
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(here, 'gst_rtsp_server.py'), '--rtsp_source', source_url,
+                 '--rotate', '0', '--address', '127.0.0.1', '--port', str(opt.port)] + JOIN_VARIANTS[variant],
+                cwd=here, stdout=subprocess.DEVNULL)
+            time.sleep(2)
+            # keeps the shared media playing, every measured client joins it mid-GOP
+            viewer = FrameCounter(relay_url)
+            time.sleep(opt.warmup)
+
+            times = []
+            for _ in range(opt.joins):
+                time.sleep(random.uniform(0, opt.gap))
+                times.append(first_frame_time(relay_url, opt.timeout))
+
+            viewer.stop()
+            server.terminate()
+            server.wait()
+
+            joined = [t for t in times if t is not None]
+            print(f"{variant:<16} {len(times):>6} {percentile(joined, 50) * 1000:>8.1f} "
+                  f"{percentile(joined, 99) * 1000:>8.1f} {max(joined, default=0) * 1000:>8.1f} "
+                  f"{len(times) - len(joined):>9}")
+    finally:
+        source.terminate()
+        source.wait()
+        loop.quit()
+
+
+def bench_mosaic(opt):
+    """Viewer CPU for N separate streams vs one server side mosaic of them, with some dead tiles."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    loop = start_main_loop()
+    source = subprocess.Popen(
+        [sys.executable, os.path.join(here, 'local_rtsp_source.py'), '--port', str(opt.source_port),
+         '--count', str(opt.tiles), '--width', str(opt.width), '--height', str(opt.height),
+         '--fps', str(opt.fps), '--stream_uri', '/test'],
+        cwd=here, stdout=subprocess.DEVNULL)
+    sources = [f'rtsp://127.0.0.1:{opt.source_port}/test' + (str(i) if opt.tiles > 1 else '')
+               for i in range(opt.tiles)]
+    # nothing listens there, these tiles must show the placeholder without stalling the grid
+    dead = [f'rtsp://127.0.0.1:{opt.source_port + 1}/dead{i}' for i in range(opt.dead)]
+    time.sleep(1)
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(here, 'gst_rtsp_server.py'), '--mosaic'] + sources + dead +
+        ['--mosaic_size', f'{opt.width}x{opt.height}', '--rotate', '0',
+         '--address', '127.0.0.1', '--port', str(opt.port)],
+        cwd=here, stdout=subprocess.DEVNULL)
+    stats = ProcessStats(server.pid)
+    time.sleep(2)
+
+    print(f"{'viewer':<8} {'streams':>8} {'fps':>6} {'viewer cpu %':>13} {'server cpu %':>13}")
+    fps = 0.0
+    try:
+        for viewer, urls in (('tiles', sources), ('mosaic', [f'rtsp://127.0.0.1:{opt.port}/stream'])):
+            clients = [FrameCounter(url) for url in urls]
+            time.sleep(opt.warmup)
+            frames = [client.frames for client in clients]
+            cpu = time.process_time()
+            server_cpu = stats.cpu_seconds()
+            time.sleep(opt.duration)
+            cpu = time.process_time() - cpu
+            server_cpu = stats.cpu_seconds() - server_cpu
+            fps = min(client.frames - start for client, start in zip(clients, frames)) / opt.duration
+            for client in clients:
+                client.stop()
+            print(f"{viewer:<8} {len(urls):>8} {fps:>6.1f} {cpu / opt.duration * 100:>13.1f} "
+                  f"{server_cpu / opt.duration * 100 if viewer == 'mosaic' else float('nan'):>13.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+        source.terminate()
+        source.wait()
+        loop.quit()
+
+    if fps < opt.min_ratio * opt.fps:
+        print(f"mosaic below {opt.min_ratio * opt.fps:.1f} fps")
+        sys.exit(1)
+
+
+def interface_tx_bytes(iface):
+    with open(f'/sys/class/net/{iface}/statistics/tx_bytes') as f:
+        return int(f.read())
+
+
+def bench_multicast(opt):
+    """Egress on the loopback interface per client count, unicast vs multicast clients of one mount.
+
+    Source -> server traffic is on the same interface and the same in every
+    run; with multicast the rest should not grow with the clients.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    loop = start_main_loop()
+    source = subprocess.Popen(
+        [sys.executable, os.path.join(here, 'local_rtsp_source.py'), '--port', str(opt.source_port),
+         '--width', str(opt.width), '--height', str(opt.height), '--fps', str(opt.fps), '--stream_uri', '/test'],
+        cwd=here, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(here, 'gst_rtsp_server.py'), '--rtsp_source',
+         f'rtsp://127.0.0.1:{opt.source_port}/test', '--rotate', '0', '--multicast', opt.group,
+         '--multicast_iface', opt.iface, '--address', '127.0.0.1', '--port', str(opt.port)],
+        cwd=here, stdout=subprocess.DEVNULL)
+    stats = ProcessStats(server.pid)
+    time.sleep(2)
+
+    transports = {
+        'unicast': 'protocols=udp',
+        'multicast': f'protocols=udp-mcast multicast-iface={opt.iface}',
+    }
+    print(f"{'transport':<10} {'clients':>8} {'fps':>6} {'egress kbit/s':>14} {'server cpu %':>13}")
+    egress = {}
+    try:
+        for transport, options in transports.items():
+            for count in opt.clients:
+                clients = [FrameCounter(f'rtsp://127.0.0.1:{opt.port}/stream', options) for _ in range(count)]
+                time.sleep(opt.warmup)
+                frames = [client.frames for client in clients]
+                sent = interface_tx_bytes(opt.iface)
+                cpu = stats.cpu_seconds()
+                time.sleep(opt.duration)
+                sent = interface_tx_bytes(opt.iface) - sent
+                cpu = stats.cpu_seconds() - cpu
+                fps = min(client.frames - start for client, start in zip(clients, frames)) / opt.duration
+                for client in clients:
+                    client.stop()
+                egress[transport, count] = sent * 8 / opt.duration / 1000
+                print(f"{transport:<10} {count:>8} {fps:>6.1f} {egress[transport, count]:>14.1f} "
+                      f"{cpu / opt.duration * 100:>13.1f}")
+                # let the shared media time out before the next round
+                time.sleep(1)
+    finally:
+        server.terminate()
+        server.wait()
+        source.terminate()
+        source.wait()
+        loop.quit()
+
+    first, last = min(opt.clients), max(opt.clients)
+    growth = egress['multicast', last] / max(egress['multicast', first], 1e-9)
+    print(f"multicast egress x{growth:.2f} from {first} to {last} clients")
+    if growth > opt.max_growth:
+        sys.exit(1)
+
+
+# decode sampling modes for the sample suite, gst_client.Video_Buffer options
+SAMPLE_MODES = {
+    'all': {},
+    'stride-30': {'stride': 30},
+    'fps-1': {'target_fps': 1},
+    'keyframes': {'keyframes_only': True},
+}
+
+
+def bench_sample(opt):
+    """Client CPU and delivered fps per gst_client.Video_Buffer sampling mode."""
+    from gst_client import Video_Buffer
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    source = subprocess.Popen(
+        [sys.executable, os.path.join(here, 'local_rtsp_source.py'), '--port', str(opt.source_port),
+         '--width', str(opt.width), '--height', str(opt.height), '--fps', str(opt.fps)],
+        cwd=here, stdout=subprocess.DEVNULL)
+    time.sleep(1)
+
+    print(f"{'mode':<10} {'fps':>6} {'cpu %':>7} {'dropped enc':>12} {'dropped dec':>12}")
+    try:
+        for mode in opt.modes:
+            video = Video_Buffer(pipe=f'127.0.0.1:{opt.source_port}/test', **SAMPLE_MODES[mode])
+            time.sleep(opt.warmup)
+            frames = video.frame_seq
+            cpu = time.process_time()
+            time.sleep(opt.duration)
+            cpu = time.process_time() - cpu
+            frames = video.frame_seq - frames
+            video.stop()
+            print(f"{mode:<10} {frames / opt.duration:>6.1f} {cpu / opt.duration * 100:>7.1f} "
+                  f"{video.sampler.dropped_encoded:>12} {video.sampler.dropped_decoded:>12}")
+    finally:
+        source.terminate()
+        source.wait()
+
+
+def bench_encoders(opt):
+    """Encode throughput of every encoder available on this host, as streams per box at --fps."""
+    names = opt.encoders or available_encoders()
+    print(f"{'encoder':<16} {'codec':<6} {'fps':>8} {'cpu %':>7} {'streams':>8}")
+    for name in names:
+        encoder = ENCODERS[name]
+        pipe = Gst.parse_launch(
+            f'videotestsrc num-buffers={opt.frames} pattern=ball '
+            f'! video/x-raw,format={encoder.input_format},width={opt.width},height={opt.height},framerate={opt.fps}/1 '
+            f'! {encoder.launch(opt.bitrate, opt.fps)}! fakesink sync=false')
+        cpu = time.process_time()
+        start = time.perf_counter()
+        pipe.set_state(Gst.State.PLAYING)
+        pipe.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        pipe.set_state(Gst.State.NULL)
+
+        fps = opt.frames / elapsed
+        # hardware encoders are limited by the encoder block, software ones by CPU
+        streams = min(fps, opt.frames / max(cpu, 1e-6) * os.cpu_count()) / opt.fps
+        print(f"{name:<16} {encoder.codec:<6} {fps:>8.1f} {cpu / elapsed * 100:>7.1f} {streams:>8.1f}")
+
+
+def static_scene(opt):
+    """Frames of a mostly static camera: fixed background, sensor noise, a moving box in the motion bursts."""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (opt.height // 8, opt.width // 8, 3), dtype=np.uint8)
+    background = np.repeat(np.repeat(background, 8, axis=0), 8, axis=1)
+    noisy = [np.clip(background.astype(np.int16) + rng.integers(-opt.noise, opt.noise + 1, background.shape),
+                     0, 255).astype(np.uint8) for _ in range(8)]
+    # a burst of motion at the start of every 10 s, opt.motion of the time
+    period = opt.fps * 10
+    burst = int(period * opt.motion)
+    box = opt.height // 4
+    for i in range(opt.frames):
+        frame = noisy[i % len(noisy)]
+        if i % period < burst:
+            frame = frame.copy()
+            x = (i % period) * (opt.width - box) // max(burst, 1)
+            frame[box:2 * box, x:x + box] = 255
+        yield frame
+
+
+def bench_gate(opt):
+    """CPU and bandwidth of the python relay push + encode path with and without a ChangeGate."""
+    duration = Gst.SECOND // opt.fps
+    print(f"{'variant':<8} {'pushed':>7} {'cpu %':>7} {'cpu us/frame':>13} {'kbit/s':>8}")
+    for variant in ('every', 'gate'):
+        gate = ChangeGate(opt.threshold, opt.static_fps) if variant == 'gate' else None
+        pipe = Gst.parse_launch(
+            'appsrc name=src is-live=false block=true format=GST_FORMAT_TIME '
+            f'caps=video/x-raw,format=BGR,width={opt.width},height={opt.height},framerate={opt.fps}/1 '
+            '! videoconvert ! video/x-raw,format=I420 '
+            f'! x264enc speed-preset=ultrafast tune=zerolatency pass=qual quantizer={opt.quantizer} '
+            '! fakesink name=sink sync=false signal-handoffs=true')
+        src = pipe.get_by_name('src')
+        encoded = [0]
+        pipe.get_by_name('sink').connect('handoff', lambda sink, buf, pad: encoded.__setitem__(
+            0, encoded[0] + buf.get_size()))
+        buffer_pool = PushBufferPool()
+        source_clock = SourceClock(duration)
+        pipe.set_state(Gst.State.PLAYING)
+
+        pushed = 0
+        cpu = time.process_time()
+        # scene generation is counted too, the same for both variants
+        for seq, frame in enumerate(static_scene(opt)):
+            meta = FrameMeta(seq + 1, pts=seq * duration)
+            if gate is not None and not gate.check(frame, meta):
+                continue
+            buf = source_clock.stamp(buffer_pool.frame_to_buffer(frame), meta)
+            src.emit('push-buffer', buf)
+            pushed += 1
+        src.emit('end-of-stream')
+        pipe.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        cpu = time.process_time() - cpu
+        pipe.set_state(Gst.State.NULL)
+        buffer_pool.stop()
+
+        # as if the frames had arrived in real time
+        seconds = opt.frames / opt.fps
+        print(f"{variant:<8} {pushed:>7} {cpu / seconds * 100:>7.1f} {cpu / opt.frames * 1e6:>13.1f} "
+              f"{encoded[0] * 8 / seconds / 1000:>8.1f}")
+
+
+def bench_reconnect(opt):
+    """Kill and restart a local source under a gst_client.Video_Buffer, time the recovery."""
+    from gst_client import Video_Buffer
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(here, 'local_rtsp_source.py'), '--port', str(opt.source_port),
+               '--width', str(opt.width), '--height', str(opt.height), '--fps', str(opt.fps)]
+
+    def start_source():
+        return subprocess.Popen(command, cwd=here, stdout=subprocess.DEVNULL)
+
+    def wait_for(condition, timeout):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    source = start_source()
+    video = Video_Buffer(pipe=f'127.0.0.1:{opt.source_port}/test', stale_after=opt.stale_after)
+    supervisor = video.supervisor
+    try:
+        if not wait_for(video.frame_available, 10):
+            print("source never delivered a frame")
+            sys.exit(1)
+
+        print(f"{'cycle':>5} {'stale s':>8} {'recover s':>10} {'restarts':>9} {'rebuilds':>9}")
+        for cycle in range(opt.cycles):
+            source.kill()
+            source.wait()
+            killed = time.monotonic()
+            # the watchdog stops serving the last frame
+            stale = wait_for(lambda: not video.frame_available(), opt.down + opt.stale_after + 2)
+            stale_after = time.monotonic() - killed if stale else float('nan')
+            time.sleep(max(0.0, opt.down - (time.monotonic() - killed)))
+
+            restarts = supervisor.restarts
+            restarted = time.monotonic()
+            source = start_source()
+            if not wait_for(video.frame_available, opt.timeout):
+                print(f"{cycle:>5} no recovery within {opt.timeout}s")
+                sys.exit(1)
+            print(f"{cycle:>5} {stale_after:>8.2f} {time.monotonic() - restarted:>10.2f} "
+                  f"{supervisor.restarts - restarts:>9} {supervisor.rebuilds:>9}")
+    finally:
+        video.stop()
+        source.terminate()
+        source.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    frames_parser = sub.add_parser('frames', help="sample to numpy copy modes")
+    frames_parser.add_argument("--width", default=1920, type=int)
+    frames_parser.add_argument("--height", default=1080, type=int)
+    frames_parser.add_argument("--frames", default=300, type=int)
+    frames_parser.add_argument("--format", default='BGR', choices=PIXEL_FORMATS)
+    frames_parser.set_defaults(func=bench_frames)
+
+    push_parser = sub.add_parser('push', help="numpy frame to appsrc buffer")
+    push_parser.add_argument("--width", default=1920, type=int)
+    push_parser.add_argument("--height", default=1080, type=int)
+    push_parser.add_argument("--frames", default=300, type=int)
+    push_parser.set_defaults(func=bench_push)
+
+    fanout_parser = sub.add_parser('fanout', help="per-client fps with several RTSP clients")
+    fanout_parser.add_argument("--clients", default=4, type=int)
+    fanout_parser.add_argument("--shared", action="store_true", help="share one media between clients")
+    fanout_parser.add_argument("--port", default=8554, type=int)
+    fanout_parser.add_argument("--source_port", default=8555, type=int)
+    fanout_parser.add_argument("--fps", default=30, type=int)
+    fanout_parser.add_argument("--warmup", default=3.0, type=float)
+    fanout_parser.add_argument("--duration", default=10.0, type=float)
+    fanout_parser.add_argument("--min_ratio", default=0.8, type=float,
+                               help="fail if a client gets less than this fraction of the source fps")
+    fanout_parser.set_defaults(func=bench_fanout)
+
+    ring_parser = sub.add_parser('ring', help="queue.Queue vs FrameRing")
+    ring_parser.add_argument("--frames", default=100000, type=int)
+    ring_parser.set_defaults(func=bench_ring)
+
+    e2e_parser = sub.add_parser('e2e', help="fps, latency, CPU and memory per server variant")
+    e2e_parser.add_argument("--variants", nargs='+', default=list(SERVER_VARIANTS),
+                            choices=list(SERVER_VARIANTS))
+    e2e_parser.add_argument("--client", default='gst', choices=['gst', 'cv2'])
+    e2e_parser.add_argument("--clients", default=1, type=int)
+    e2e_parser.add_argument("--port", default=8554, type=int)
+    e2e_parser.add_argument("--source_port", default=8555, type=int)
+    e2e_parser.add_argument("--width", default=1920, type=int)
+    e2e_parser.add_argument("--height", default=1080, type=int)
+    e2e_parser.add_argument("--fps", default=30, type=int)
+    e2e_parser.add_argument("--warmup", default=3.0, type=float)
+    e2e_parser.add_argument("--duration", default=10.0, type=float)
+    e2e_parser.add_argument("--min_ratio", default=0.8, type=float,
+                            help="fail if a variant delivers less than this fraction of the source fps")
+    e2e_parser.set_defaults(func=bench_e2e)
+
+    scale_parser = sub.add_parser('scale', help="CPU and memory per stream in a multi-stream server")
+    scale_parser.add_argument("--streams", nargs='+', default=[1, 2, 4, 8], type=int)
+    scale_parser.add_argument("--passthrough", action="store_true")
+    scale_parser.add_argument("--hook", default=None, help="module:function to force the python relay path")
+    scale_parser.add_argument("--pixel_format", default='BGR', choices=['BGR', 'NV12', 'I420'],
+                              help="format frames are held in on the python relay path")
+    scale_parser.add_argument("--buffer_mb", default=64, type=int)
+    scale_parser.add_argument("--buffer_latency", default=1.0, type=float)
+    scale_parser.add_argument("--port", default=8554, type=int)
+    scale_parser.add_argument("--source_port", default=8555, type=int)
+    scale_parser.add_argument("--width", default=1280, type=int)
+    scale_parser.add_argument("--height", default=720, type=int)
+    scale_parser.add_argument("--fps", default=30, type=int)
+    scale_parser.add_argument("--warmup", default=3.0, type=float)
+    scale_parser.add_argument("--duration", default=10.0, type=float)
+    scale_parser.set_defaults(func=bench_scale)
+
+    ttff_parser = sub.add_parser('ttff', help="time to first frame when joining a playing stream")
+    ttff_parser.add_argument("--variants", nargs='+', default=list(JOIN_VARIANTS), choices=list(JOIN_VARIANTS))
+    ttff_parser.add_argument("--joins", default=20, type=int)
+    ttff_parser.add_argument("--gap", default=2.0, type=float, help="max random pause between joins")
+    ttff_parser.add_argument("--timeout", default=15.0, type=float)
+    ttff_parser.add_argument("--port", default=8554, type=int)
+    ttff_parser.add_argument("--source_port", default=8555, type=int)
+    ttff_parser.add_argument("--width", default=1280, type=int)
+    ttff_parser.add_argument("--height", default=720, type=int)
+    ttff_parser.add_argument("--fps", default=30, type=int)
+    ttff_parser.add_argument("--warmup", default=3.0, type=float)
+    ttff_parser.set_defaults(func=bench_ttff)
+
+    mosaic_parser = sub.add_parser('mosaic', help="viewer CPU for separate streams vs one mosaic")
+    mosaic_parser.add_argument("--tiles", default=9, type=int, help="live local sources")
+    mosaic_parser.add_argument("--dead", default=1, type=int, help="extra sources that never answer")
+    mosaic_parser.add_argument("--port", default=8554, type=int)
+    mosaic_parser.add_argument("--source_port", default=8555, type=int)
+    mosaic_parser.add_argument("--width", default=1920, type=int)
+    mosaic_parser.add_argument("--height", default=1080, type=int)
+    mosaic_parser.add_argument("--fps", default=30, type=int)
+    mosaic_parser.add_argument("--warmup", default=3.0, type=float)
+    mosaic_parser.add_argument("--duration", default=10.0, type=float)
+    mosaic_parser.add_argument("--min_ratio", default=0.8, type=float,
+                               help="fail if the mosaic delivers less than this fraction of --fps")
+    mosaic_parser.set_defaults(func=bench_mosaic)
+
+    multicast_parser = sub.add_parser('multicast', help="loopback egress per client count, unicast vs multicast")
+    multicast_parser.add_argument("--clients", nargs='+', default=[1, 2, 4, 8], type=int)
+    multicast_parser.add_argument("--group", default='239.255.42.1-239.255.42.16', help="multicast range")
+    multicast_parser.add_argument("--iface", default='lo')
+    multicast_parser.add_argument("--port", default=8554, type=int)
+    multicast_parser.add_argument("--source_port", default=8555, type=int)
+    multicast_parser.add_argument("--width", default=1280, type=int)
+    multicast_parser.add_argument("--height", default=720, type=int)
+    multicast_parser.add_argument("--fps", default=30, type=int)
+    multicast_parser.add_argument("--warmup", default=3.0, type=float)
+    multicast_parser.add_argument("--duration", default=10.0, type=float)
+    multicast_parser.add_argument("--max_growth", default=1.5, type=float,
+                                  help="fail if multicast egress grows more than this over the client counts")
+    multicast_parser.set_defaults(func=bench_multicast)
+
+    sample_parser = sub.add_parser('sample', help="client CPU per decode sampling mode")
+    sample_parser.add_argument("--modes", nargs='+', default=list(SAMPLE_MODES), choices=list(SAMPLE_MODES))
+    sample_parser.add_argument("--source_port", default=8555, type=int)
+    sample_parser.add_argument("--width", default=1920, type=int)
+    sample_parser.add_argument("--height", default=1080, type=int)
+    sample_parser.add_argument("--fps", default=30, type=int)
+    sample_parser.add_argument("--warmup", default=2.0, type=float)
+    sample_parser.add_argument("--duration", default=10.0, type=float)
+    sample_parser.set_defaults(func=bench_sample)
+
+    encoders_parser = sub.add_parser('encoders', help="encode throughput per available encoder")
+    encoders_parser.add_argument("--encoders", nargs='+', default=None, choices=list(ENCODERS))
+    encoders_parser.add_argument("--frames", default=300, type=int)
+    encoders_parser.add_argument("--width", default=1920, type=int)
+    encoders_parser.add_argument("--height", default=1080, type=int)
+    encoders_parser.add_argument("--fps", default=30, type=int)
+    encoders_parser.add_argument("--bitrate", default=2048, type=int, help="kbit/s")
+    encoders_parser.set_defaults(func=bench_encoders)
+
+    gate_parser = sub.add_parser('gate', help="relay CPU and bandwidth with the change gate on a static scene")
+    gate_parser.add_argument("--frames", default=900, type=int)
+    gate_parser.add_argument("--width", default=1280, type=int)
+    gate_parser.add_argument("--height", default=720, type=int)
+    gate_parser.add_argument("--fps", default=30, type=int)
+    gate_parser.add_argument("--motion", default=0.1, type=float, help="fraction of the time with motion")
+    gate_parser.add_argument("--noise", default=2, type=int, help="sensor noise amplitude")
+    gate_parser.add_argument("--threshold", default=2.0, type=float)
+    gate_parser.add_argument("--static_fps", default=2, type=int)
+    gate_parser.add_argument("--quantizer", default=23, type=int, help="x264 constant quantizer")
+    gate_parser.set_defaults(func=bench_gate)
+
+    reconnect_parser = sub.add_parser('reconnect', help="time to recover after the source restarts")
+    reconnect_parser.add_argument("--cycles", default=3, type=int)
+    reconnect_parser.add_argument("--down", default=5.0, type=float, help="seconds the source stays down")
+    reconnect_parser.add_argument("--stale_after", default=2.0, type=float)
+    reconnect_parser.add_argument("--timeout", default=60.0, type=float)
+    reconnect_parser.add_argument("--source_port", default=8555, type=int)
+    reconnect_parser.add_argument("--width", default=1280, type=int)
+    reconnect_parser.add_argument("--height", default=720, type=int)
+    reconnect_parser.add_argument("--fps", default=30, type=int)
+    reconnect_parser.set_defaults(func=bench_reconnect)
+
+    opt = parser.parse_args()
+    Gst.init(None)
+    opt.func(opt)
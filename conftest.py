@@ -0,0 +1,2 @@
+# test_rtsp_client.py is a manual client against a running server, not a test module
+collect_ignore = ['test_rtsp_client.py']
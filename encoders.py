@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Encoder helpers for the RTSP relay.
+
+ENCODERS maps the encoder elements we know how to drive (software and
+hardware, H.264 and H.265) to their property names. select_encoder()
+probes which of them work on this host and picks the first one in
+ENCODER_PRIORITY, encode_launch() builds the convert ! encode ! pay
+tail of a media launch string for it.
+
+    python3 encoders.py    # list the encoders available here
+
+EncoderController adapts a running encoder to CPU pressure without
+restarting the media, request_keyframe() asks an encoder for an IDR.
+"""
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstVideo', '1.0')
+from gi.repository import Gst, GstVideo, GLib
+
+import metrics
+
+
+# parser / payloader per output codec
+CODECS = {
+    'h264': {'caps': 'video/x-h264', 'parse': 'h264parse', 'pay': 'rtph264pay'},
+    'h265': {'caps': 'video/x-h265', 'parse': 'h265parse', 'pay': 'rtph265pay'},
+}
+
+
+class Encoder:
+    """How to drive one encoder element.
+
+    Common knobs are mapped onto the element's own properties: bitrate in
+    kbit/s (times bitrate_scale), gop in frames and low latency tuning.
+    The profile is set through the caps after the encoder, which every
+    encoder negotiates. input_format is the raw format fed to it.
+    """
+    def __init__(self, element, codec, input_format='I420', bitrate='bitrate', bitrate_scale=1,
+                 gop='key-int-max', low_latency=''):
+        self.element = element
+        self.codec = codec
+        self.input_format = input_format
+        self.bitrate = bitrate
+        self.bitrate_scale = bitrate_scale
+        self.gop = gop
+        self.low_latency = low_latency
+
+    def launch(self, bitrate=None, gop=None, low_latency=True, name='encoder'):
+        properties = [f'name={name}']
+        if low_latency and self.low_latency:
+            properties.append(self.low_latency)
+        if bitrate:
+            properties.append(f'{self.bitrate}={int(bitrate * self.bitrate_scale)}')
+        if gop:
+            properties.append(f'{self.gop}={gop}')
+        return f'{self.element} {" ".join(properties)} '
+
+    def caps(self, profile=None, au=False):
+        caps = CODECS[self.codec]['caps']
+        if au:
+            caps += ',stream-format=byte-stream,alignment=au'
+        if profile:
+            caps += f',profile={profile}'
+        return caps
+
+
+ENCODERS = {encoder.element: encoder for encoder in (
+    Encoder('x264enc', 'h264', low_latency='speed-preset=ultrafast tune=zerolatency'),
+    Encoder('x265enc', 'h265', low_latency='speed-preset=ultrafast tune=zerolatency'),
+    Encoder('openh264enc', 'h264', bitrate_scale=1000, gop='gop-size',
+            low_latency='usage-type=camera complexity=low rate-control=bitrate'),
+    # Rockchip MPP (RK3588 ...)
+    Encoder('mpph264enc', 'h264', 'NV12', bitrate='bps', bitrate_scale=1000, gop='gop'),
+    Encoder('mpph265enc', 'h265', 'NV12', bitrate='bps', bitrate_scale=1000, gop='gop'),
+    Encoder('nvh264enc', 'h264', 'NV12', gop='gop-size', low_latency='zerolatency=true'),
+    Encoder('nvh265enc', 'h265', 'NV12', gop='gop-size', low_latency='zerolatency=true'),
+    Encoder('vah264enc', 'h264', 'NV12', low_latency='target-usage=7'),
+    Encoder('vah265enc', 'h265', 'NV12', low_latency='target-usage=7'),
+    Encoder('avenc_h264_omx', 'h264', bitrate_scale=1000, gop='gop-size'),
+)}
+
+# hardware first, then software; encoders of the other codec are skipped
+ENCODER_PRIORITY = ('mpph264enc', 'mpph265enc', 'nvh264enc', 'nvh265enc', 'vah264enc', 'vah265enc',
+                    'x264enc', 'openh264enc', 'avenc_h264_omx', 'x265enc')
+
+_probed = {}
+
+
+def probe_encoder(name):
+    """True if the element exists and opens (hardware encoders fail in READY without a device)."""
+    if name not in _probed:
+        element = Gst.ElementFactory.make(name, None)
+        ok = element is not None and element.set_state(Gst.State.READY) != Gst.StateChangeReturn.FAILURE
+        if element is not None:
+            element.set_state(Gst.State.NULL)
+        _probed[name] = ok
+    return _probed[name]
+
+
+def available_encoders(codec=None):
+    return [name for name, encoder in ENCODERS.items()
+            if (codec is None or encoder.codec == codec) and probe_encoder(name)]
+
+
+def select_encoder(codec='h264', name=None, priority=ENCODER_PRIORITY):
+    """Encoder for codec, the named one or the first available in priority."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {tuple(CODECS)}")
+    if name:
+        encoder = ENCODERS.get(name)
+        if encoder is None:
+            raise ValueError(f"Unknown encoder {name!r}, expected one of {tuple(ENCODERS)}")
+        if not probe_encoder(name):
+            raise RuntimeError(f"Encoder {name} is not available on this host")
+        return encoder
+    priority = priority or ENCODER_PRIORITY
+    for candidate in priority:
+        encoder = ENCODERS.get(candidate)
+        if encoder is not None and encoder.codec == codec and probe_encoder(candidate):
+            return encoder
+    raise RuntimeError(f"No {codec} encoder available, tried {', '.join(priority)}")
+
+
+def encode_launch(encoder, bitrate=None, gop=None, profile=None, low_latency=True, raw_format=None):
+    """'! convert ! scaler ! encoder ! payloader' tail of a media launch string.
+
+    The videoscale / capsfilter pair passes through unless EncoderController
+    steps the output size down. The videoconvert is left out when the raw
+    frames already come in raw_format and the encoder takes that format.
+    """
+    convert = '' if raw_format == encoder.input_format \
+        else f'! videoconvert ! video/x-raw,format={encoder.input_format} '
+    return f'{convert}! videoscale name=scaler ! capsfilter name=scalecaps caps=video/x-raw ' \
+           f'! {encoder.launch(bitrate, gop, low_latency)}! {encoder.caps(profile)} ' \
+           f'! {CODECS[encoder.codec]["pay"]} config-interval=1 name=pay0 pt=96'
+
+
+def request_keyframe(pad):
+    """Ask the encoder upstream of sink pad for a keyframe with SPS / PPS.
+
+    push_event() hands the upstream event to the pad's peer, send_event()
+    on a sink pad would reject it as going the wrong way.
+    """
+    event = GstVideo.video_event_new_upstream_force_key_unit(Gst.CLOCK_TIME_NONE, True, 0)
+    ok = pad.push_event(event)
+    if not ok:
+        parent = pad.get_parent_element()
+        print(f"keyframe request upstream of {parent.get_name() if parent else pad.get_name()} was not handled")
+    return ok
+
+
+class EncoderController:
+    """Feedback loop on one media's encoder.
+
+    Every interval it looks at the media's queue depth, frame drops and
+    encode latency. Under pressure it moves one step down LADDER (lower
+    bitrate, then smaller output size); after recover_after calm
+    intervals it moves one step back up.
+
+    The bitrate is only set if the encoder allows it in PLAYING (spec
+    maps the name for non-x264 encoders), the output size is changed
+    through the capsfilter in front of the encoder, which renegotiates in
+    place. GOP and preset are left alone, x264enc cannot change them
+    while playing.
+    """
+    # (bitrate factor, output scale)
+    LADDER = (
+        (1.0, 1.0),
+        (0.7, 1.0),
+        (0.5, 0.75),
+        (0.35, 0.5),
+    )
+
+    def __init__(self, encoder, scaler, scalecaps, frames, latency, frame_duration,
+                 bitrate=2048, interval=1.0, depth_high=3,
+                 recover_after=5, name='', spec=None):
+        self.encoder = encoder
+        self.spec = spec or ENCODERS['x264enc']
+        self.scaler = scaler
+        self.scalecaps = scalecaps
+        self.frames = frames
+        self.latency = latency
+        self.frame_duration = frame_duration
+        self.bitrate = bitrate
+        self.interval = interval
+        self.depth_high = depth_high
+        self.recover_after = recover_after
+        self.name = name
+
+        self.level = 0
+        self.calm = 0
+        self.push_errors = 0
+        self.running = False
+        self._dropped = 0
+        self._push_errors = 0
+
+    def start(self):
+        self.running = True
+        GLib.timeout_add(int(self.interval * 1000), self.tick)
+
+    def stop(self):
+        self.running = False
+
+    def tick(self):
+        if not self.running:
+            return False
+
+        dropped = self.frames.dropped - self._dropped
+        self._dropped = self.frames.dropped
+        push_errors = self.push_errors - self._push_errors
+        self._push_errors = self.push_errors
+        depth = self.frames.qsize()
+        encode = self.latency.percentile('encode', 50) or 0.0
+
+        if depth >= self.depth_high or dropped or push_errors or encode > 1.5 * self.frame_duration:
+            self.calm = 0
+            if self.level < len(self.LADDER) - 1:
+                self.set_level(self.level + 1)
+        elif depth <= 1 and encode < 0.75 * self.frame_duration:
+            self.calm += 1
+            if self.calm >= self.recover_after and self.level > 0:
+                self.calm = 0
+                self.set_level(self.level - 1)
+        return True
+
+    def set_level(self, level):
+        bitrate_factor, scale = self.LADDER[level]
+        print(f"{self.name}: encoder level {self.level} -> {level}")
+        self.level = level
+
+        self._set(self.spec.bitrate, int(self.bitrate * bitrate_factor * self.spec.bitrate_scale))
+        self._scale(scale)
+        metrics.ENCODER_LEVEL.set(level, stream=self.name)
+
+    def _set(self, name, value):
+        pspec = self.encoder.find_property(name)
+        if pspec is None or not pspec.flags & Gst.PARAM_MUTABLE_PLAYING:
+            return False
+        Gst.util_set_object_arg(self.encoder, name, str(value))
+        return True
+
+    def _scale(self, scale):
+        if scale == 1.0:
+            self.scalecaps.set_property('caps', Gst.Caps.from_string('video/x-raw'))
+            return
+        caps = self.scaler.get_static_pad('sink').get_current_caps()
+        if caps is None:
+            return
+        structure = caps.get_structure(0)
+        # x264 wants even dimensions
+        width = int(structure.get_value('width') * scale) // 2 * 2
+        height = int(structure.get_value('height') * scale) // 2 * 2
+        self.scalecaps.set_property(
+            'caps', Gst.Caps.from_string(f'video/x-raw,width={width},height={height}'))
+
+
+if __name__ == "__main__":
+    Gst.init(None)
+    for codec in CODECS:
+        names = available_encoders(codec)
+        best = select_encoder(codec).element if names else '-'
+        print(f"{codec}: {', '.join(names) or 'none'} (using {best})")
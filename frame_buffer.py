@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frame buffering between the capture side (Video_Buffer / FrameCaptureThread)
+and the RTSP media appsrc's, or asyncio consumers (AsyncFrameStream).
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+
+# slot sequence number while the producer is replacing the frame in it
+_WRITING = -1
+# slot sequence number of a frame released by FrameHub's byte / age budget
+_EVICTED = -2
+
+
+def frame_nbytes(frame):
+    """Bytes held by a frame: an array, a tuple of planes or a Gst.Buffer."""
+    if isinstance(frame, tuple):
+        return sum(frame_nbytes(plane) for plane in frame)
+    nbytes = getattr(frame, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    return frame.get_size() if hasattr(frame, 'get_size') else 0
+
+
+class FrameRing:
+    """Fixed-capacity single-producer ring, latest-wins / drop-oldest.
+
+    put() never blocks and takes no lock: slots are a preallocated list
+    guarded by a per-slot sequence number (seqlock), so a reader that was
+    lapped by the producer notices it and skips ahead instead of returning
+    a newer frame out of order. Frames are stored by reference.
+
+    Counters:
+        overwrites : frames replaced by put() before the consumer read them
+        drops      : frames the consumer skipped because it fell behind
+    """
+    def __init__(self, capacity=30):
+        if capacity < 2:
+            raise ValueError("FrameRing needs a capacity of at least 2")
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._seqs = [0] * capacity
+        self.write_seq = 0
+        self.read_seq = 0
+        # oldest seq readers may still get, raised when FrameHub releases frames early.
+        # Seqs start at 1, there is no frame 0 to release.
+        self.tail = 1
+        self.overwrites = 0
+        self.drops = 0
+        # only used to park consumers while the ring is empty
+        self._cond = threading.Condition()
+        self._waiters = 0
+
+    def _write(self, frame):
+        seq = self.write_seq + 1
+        index = seq % self.capacity
+        self._seqs[index] = _WRITING
+        self._slots[index] = frame
+        self._seqs[index] = seq
+        self.write_seq = seq
+        if self._waiters:
+            with self._cond:
+                self._cond.notify_all()
+
+    def _read(self, cursor, max_lag):
+        """Next frame after cursor, returns (cursor, frame, dropped)."""
+        dropped = 0
+        while True:
+            write_seq = self.write_seq
+            if write_seq <= cursor:
+                raise queue.Empty
+            floor = max(write_seq - max_lag, self.tail - 1)
+            if cursor < floor:
+                dropped += floor - cursor
+                cursor = floor
+            seq = cursor + 1
+            index = seq % self.capacity
+            before = self._seqs[index]
+            frame = self._slots[index]
+            if before == seq and self._seqs[index] == seq:
+                return seq, frame, dropped
+            # lapped or released while reading, go around with the new write position / tail
+
+    def _wait(self, cursor, timeout):
+        with self._cond:
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(lambda: self.write_seq > cursor, timeout)
+            finally:
+                self._waiters -= 1
+
+    def _max_lag(self, max_lag):
+        return min(max_lag or self.capacity, self.capacity - 1)
+
+    def put(self, frame):
+        if self.write_seq + 1 - self.read_seq > self._max_lag(None):
+            self.overwrites += 1
+        self._write(frame)
+
+    def get_nowait(self, latest=False):
+        max_lag = 1 if latest else self._max_lag(None)
+        self.read_seq, frame, dropped = self._read(self.read_seq, max_lag)
+        self.drops += dropped
+        return frame
+
+    def get(self, timeout=None, latest=False):
+        try:
+            return self.get_nowait(latest)
+        except queue.Empty:
+            if not self._wait(self.read_seq, timeout):
+                raise
+        return self.get_nowait(latest)
+
+    def _pending(self, cursor, max_lag):
+        return min(self.write_seq - max(cursor, self.tail - 1), max_lag)
+
+    def qsize(self):
+        return self._pending(self.read_seq, self._max_lag(None))
+
+
+class FrameHub(FrameRing):
+    """Publish each frame once, every subscriber reads it through its own cursor.
+
+    Frames are never copied per subscriber. A slow subscriber loses its
+    oldest frames instead of stalling the publisher or taking frames
+    away from other subscribers.
+
+    max_bytes / max_age bound the hub besides capacity: on every publish
+    the oldest frames are released until the frames held fit in max_bytes
+    and none was published more than max_age seconds earlier. The newest
+    frame is always kept. Subscribers skip released frames and count them
+    as dropped, the same as frames they were lapped on. Subscribers also
+    skip frames older than max_age on read, in case the source stalled.
+    """
+    def __init__(self, capacity=30, max_bytes=None, max_age=None):
+        super(FrameHub, self).__init__(capacity)
+        self.subscribers = set()
+        # drops of subscriptions that were already closed
+        self.retired_drops = 0
+        # seq of the last frame published as a keyframe, 0 if none
+        self.keyframe_seq = 0
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # bytes of the frames held, and frames released by the budget
+        self.bytes = 0
+        self.evictions = 0
+        self._sizes = [0] * capacity
+        self._times = [0.0] * capacity
+        # subscription -> callback of subscriptions waiting for the next publish, see Subscription.notify()
+        self._starved = {}
+
+    def publish(self, frame, meta=None, keyframe=False):
+        index = (self.write_seq + 1) % self.capacity
+        size = frame_nbytes(frame)
+        self.bytes += size - self._sizes[index]
+        self._sizes[index] = size
+        self._times[index] = time.monotonic()
+        self._write((frame, meta))
+        if keyframe:
+            self.keyframe_seq = self.write_seq
+        self.tail = max(self.tail, self.write_seq - self.capacity + 1)
+        if self.max_bytes is not None or self.max_age is not None:
+            self._evict()
+        if self._starved:
+            with self._cond:
+                starved, self._starved = self._starved, {}
+            for callback in starved.values():
+                callback()
+
+    def _fresh(self, seq):
+        """False if frame seq was published more than max_age seconds ago."""
+        return self.max_age is None or self._times[seq % self.capacity] >= time.monotonic() - self.max_age
+
+    def _wake(self, subscription):
+        with self._cond:
+            callback = self._starved.pop(subscription, None)
+        if callback is not None:
+            callback()
+
+    def _evict(self):
+        oldest = self._times[self.write_seq % self.capacity] - (self.max_age or float('inf'))
+        while self.tail < self.write_seq:
+            index = self.tail % self.capacity
+            if not (self.max_bytes is not None and self.bytes > self.max_bytes
+                    or self._times[index] < oldest):
+                break
+            self._seqs[index] = _EVICTED
+            self._slots[index] = None
+            self.bytes -= self._sizes[index]
+            self._sizes[index] = 0
+            self.tail += 1
+            self.evictions += 1
+
+    def subscribe(self, max_lag=None, from_keyframe=False):
+        """New subscription starting at the next published frame.
+
+        With from_keyframe it starts at the last keyframe instead, if that
+        is still in the ring, so an encoded subscriber gets the whole
+        current GOP right away (GOP cache).
+        """
+        subscription = Subscription(self, self._max_lag(max_lag))
+        keyframe_seq = self.keyframe_seq
+        if from_keyframe and keyframe_seq and keyframe_seq >= self.tail \
+                and self.write_seq - keyframe_seq < subscription.max_lag:
+            subscription.cursor = keyframe_seq - 1
+        with self._cond:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._cond:
+            self._starved.pop(subscription, None)
+            if subscription in self.subscribers:
+                self.subscribers.discard(subscription)
+                self.retired_drops += subscription.dropped
+
+    def dropped_total(self):
+        """Frames dropped by all subscriptions, open or closed."""
+        return self.retired_drops + sum(s.dropped for s in list(self.subscribers))
+
+    def max_depth(self):
+        """Frames waiting in the most backed up subscription."""
+        return max((s.qsize() for s in list(self.subscribers)), default=0)
+
+
+class Subscription:
+    """Bounded cursor into a FrameHub with drop-oldest semantics.
+
+    get() follows the queue.Queue interface so it can stand in for the
+    old shared frame_queue, get_with_meta() also returns the FrameMeta
+    the frame was published with.
+    """
+    def __init__(self, hub, max_lag):
+        self.hub = hub
+        self.max_lag = max_lag
+        self.cursor = hub.write_seq
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+
+    def qsize(self):
+        return self.hub._pending(self.cursor, self.max_lag)
+
+    def _next(self):
+        while True:
+            self.cursor, item, dropped = self.hub._read(self.cursor, self.max_lag)
+            self.dropped += dropped
+            # publish() only releases old frames while the source is delivering, a stalled one
+            # would leave them readable past max_age
+            if self.hub._fresh(self.cursor):
+                break
+            self.dropped += 1
+        self.delivered += 1
+        return item
+
+    def get_with_meta(self, timeout=None):
+        try:
+            return self._next()
+        except queue.Empty:
+            if not self.hub._wait(self.cursor, timeout):
+                raise
+        return self._next()
+
+    def get_nowait(self):
+        return self._next()[0]
+
+    def notify(self, callback):
+        """Call callback() once, on the publishing thread, as soon as a frame is pending.
+
+        Lets a consumer that found the subscription empty sleep until the
+        next publish instead of polling it.
+        """
+        if self.closed:
+            return
+        with self.hub._cond:
+            self.hub._starved[self] = callback
+        # published in between the consumer's last read and now
+        if self.hub.write_seq > self.cursor:
+            self.hub._wake(self)
+
+    def get(self, timeout=None):
+        return self.get_with_meta(timeout)[0]
+
+    def close(self):
+        self.closed = True
+        self.hub.unsubscribe(self)
+
+
+class AsyncFrameStream:
+    """Hands frames from a GStreamer streaming thread to an asyncio consumer.
+
+    push() is called on the streaming thread, get() / async for on the
+    event loop. The loop is only woken through call_soon_threadsafe, at
+    most once per batch of frames, so idle consumers cost nothing.
+
+    policy
+        latest  : keep only the newest frame, older unread ones are dropped
+        bounded : keep up to maxsize frames, drop the oldest when full
+        block   : keep up to maxsize frames, push() waits for the consumer
+    """
+    POLICIES = ('latest', 'bounded', 'block')
+
+    def __init__(self, policy='latest', maxsize=8, loop=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {self.POLICIES}")
+        self.policy = policy
+        self.maxsize = 1 if policy == 'latest' else max(maxsize, 1)
+        self.loop = loop or asyncio.get_running_loop()
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._waiter = None
+        self._wakeup_pending = False
+
+    def push(self, frame, meta=None):
+        with self._cond:
+            if self.policy == 'block':
+                self._cond.wait_for(lambda: len(self._items) < self.maxsize or self.closed)
+            if self.closed:
+                return
+            while len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append((frame, meta))
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        try:
+            self.loop.call_soon_threadsafe(self._wakeup)
+        except RuntimeError:
+            # loop already closed
+            self.closed = True
+
+    def _wakeup(self):
+        with self._cond:
+            self._wakeup_pending = False
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout=None):
+        """Next (frame, meta), raises asyncio.TimeoutError / StopAsyncIteration."""
+        while True:
+            with self._cond:
+                if self._items:
+                    item = self._items.popleft()
+                    self.delivered += 1
+                    self._cond.notify_all()
+                    return item
+                if self.closed:
+                    raise StopAsyncIteration
+                self._waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            finally:
+                self._waiter = None
+
+    def qsize(self):
+        return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wakeup)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
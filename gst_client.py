@@ -1,6 +1,10 @@
 
 
-import numpy as np
+import asyncio
+import sys
+import threading
+import traceback
+from datetime import datetime
 
 import gi
 
@@ -8,9 +12,21 @@ gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 Gst.init(None)
 
+from gst_frame import DecodeSampler, FramePool, output_caps, sample_meta, sample_to_array
+from frame_buffer import AsyncFrameStream
+from reconnect import SourceSupervisor
+
 class Video_Buffer:
-    def __init__(self, pipe="video1", appsink_name="video_sink"):
+    def __init__(self, pipe="video1", appsink_name="video_sink", copy_mode='dup', pool_size=4, stale_after=5.0,
+                 pixel_format='BGR', width=None, height=None, keyframes_only=False, stride=1, target_fps=None):
         self._frame = None
+        self._meta = None
+        self.copy_mode = copy_mode
+        self.frame_pool = FramePool(pool_size) if copy_mode == 'pool' else None
+        # sequence number of the last decoded frame, bumped once per new-sample
+        self.frame_seq = 0
+        self.frame_callbacks = []
+        self._callbacks_lock = threading.Lock()
         # self.video_source = f'rtspsrc location=rtsp://{pipe} latency=10 buffer-mode=0 protocols=tcp'
         self.video_source = f'rtspsrc location=rtsp://{pipe} latency=10'
 
@@ -18,48 +34,45 @@ class Video_Buffer:
         self.video_codec = '! rtph264depay ! h264parse '  # 'application/x-rtp' 생략
         # self.video_codec = '! application/x-rtp, encoding-name=(string)H264, payload=96 ! rtph264depay ! h264parse '
         # self.video_decode = f'! decodebin ! videoscale ! video/x-raw,width=640,height=480 ! videoconvert ! video/x-raw,format=(string)BGR ! appsink name={appsink_name} emit-signals=true sync=false max-buffers=3 drop=true'
-        self.video_decode = f'! decodebin ! videoscale ! video/x-raw,width=1920,height=1080 ! videoconvert ! video/x-raw,format=(string)BGR ! appsink name={appsink_name} emit-signals=true sync=false max-buffers=3 drop=true'
+        # native size unless width / height are given; GRAY8, NV12 and I420 skip the BGR conversion
+        self.video_decode = f'! decodebin name=decoder {output_caps(pixel_format, width, height)}! appsink name={appsink_name} emit-signals=true sync=false max-buffers=3 drop=true'
         
         # self.video_decode = f'! decodebin ! videoconvert ! appsink name={appsink_name} emit-signals=true sync=false max-buffers=10 drop=true'
         
         # self.video_decode = f'! decodebin ! videorate ! video/x-raw,framerate=30/1,format=(string)BGR ! videoconvert ! appsink name={appsink_name} emit-signals=true sync=false max-buffers=3 drop=true'
         
+        # low rate analytics: drop frames before / right after the decoder, see DecodeSampler
+        self.sampler = DecodeSampler(keyframes_only, stride, target_fps)
+
         self.video_pipe = None
         self.video_sink = None
         self.appsink_name = appsink_name
+        self.name = pipe
+        self.stale_after = stale_after
+        self.supervisor = None
         self.run()
 
-    def start_gst(self, config=None):
-        if not config:
-            config = [
-                'videotestsrc ! decodebin',
-                '! videoconvert ! video/x-raw,format=(string)BGR ! appsink name={self.appsink_name}'
-            ]
-
-        command = ' '.join(config)
-        self.video_pipe = Gst.parse_launch(command)
-        self.video_pipe.set_state(Gst.State.PLAYING)
-        self.video_sink = self.video_pipe.get_by_name(self.appsink_name)
-        
+    def attach_sink(self, pipeline):
+        # called by the supervisor after every (re)build of the pipeline
+        self.video_pipe = pipeline
+        self.video_sink = pipeline.get_by_name(self.appsink_name)
+        if self.sampler.active:
+            decoder = pipeline.get_by_name('decoder')
+            # most frames never reach the appsink, count the source as alive on encoded data
+            decoder.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, self.on_encoded)
+            self.sampler.attach(decoder)
+
         if not self.video_sink:
             print(f"Failed to get appsink named {self.appsink_name}")
             return
-        
+
         self.video_sink.set_property("emit-signals", True)
         self.video_sink.set_property("sync", False)
+        self.video_sink.connect('new-sample', self.callback)
 
     @staticmethod
-    def gst_to_opencv(sample):
-        buf = sample.get_buffer()
-        caps = sample.get_caps()
-        array = np.ndarray(
-            (
-                caps.get_structure(0).get_value('height'),
-                caps.get_structure(0).get_value('width'),
-                3
-            ),
-            buffer=buf.extract_dup(0, buf.get_size()), dtype=np.uint8)
-        return array
+    def gst_to_opencv(sample, copy_mode='dup', frame_pool=None):
+        return sample_to_array(sample, copy_mode, frame_pool)
 
     def get_frame(self):
         return self._frame
@@ -67,70 +80,105 @@ class Video_Buffer:
     def frame_available(self):
         return self._frame is not None
 
+    def get_meta(self):
+        """FrameMeta (seq, pts, capture_time) of the frame get_frame() returns."""
+        return self._meta
+
+    def add_frame_callback(self, func):
+        """Call func(frame, meta) once for every decoded frame, on the streaming thread."""
+        with self._callbacks_lock:
+            self.frame_callbacks = self.frame_callbacks + [func]
+
+    def remove_frame_callback(self, func):
+        with self._callbacks_lock:
+            self.frame_callbacks = [f for f in self.frame_callbacks if f is not func]
+
+    async def frames(self, policy='latest', maxsize=8, timeout=None):
+        """Async iterator of (frame, meta), see frame_buffer.AsyncFrameStream for policies.
+
+            async for frame, meta in video.frames():
+                ...
+
+        Raises asyncio.TimeoutError when no frame arrives within timeout seconds.
+        """
+        stream = AsyncFrameStream(policy, maxsize)
+        self.add_frame_callback(stream.push)
+        try:
+            while True:
+                try:
+                    yield await stream.get(timeout)
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.remove_frame_callback(stream.push)
+            stream.close()
+
     def run(self):
         try:
-            self.start_gst(
-                [
-                    self.video_source,
-                    self.video_codec,
-                    # ' ! queue leaky=downstream max-size-buffers=10 ',
-                    self.video_decode
-                ]
-            )
-            if self.video_sink:
-                self.video_sink.connect('new-sample', self.callback)
-
-            bus = self.video_pipe.get_bus()
-            bus.add_signal_watch()
-            bus.connect("message", self.on_message)
+            command = ' '.join([
+                self.video_source,
+                self.video_codec,
+                # ' ! queue leaky=downstream max-size-buffers=10 ',
+                self.video_decode
+            ])
+            # reconnects with backoff from its own thread, no GLib main loop needed
+            self.supervisor = SourceSupervisor(command, self.attach_sink, self.name,
+                                               stale_after=self.stale_after, on_stale=self.on_stale)
+            self.supervisor.start()
         except Exception as e:
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             tb = traceback.format_exc()
             print(f"Error occurred at {current_time}: {e}\n{tb}", file=sys.stderr)
 
-    def on_message(self, bus, message):
-        t = message.type
-        if t == Gst.MessageType.ERROR or t == Gst.MessageType.EOS:
-            self.video_pipe.set_state(Gst.State.NULL)
-            self.run()
+    def on_encoded(self, pad, info):
+        self.supervisor.frame_arrived()
+        return Gst.PadProbeReturn.OK
+
+    def on_stale(self):
+        # frame_available() is False again until the source delivers a new frame
+        self._frame = None
+        self._meta = None
 
     def callback(self, sink):
+        self.supervisor.frame_arrived()
         sample = sink.emit('pull-sample')
-        new_frame = self.gst_to_opencv(sample)
+        meta = sample_meta(sample, self.frame_seq + 1)
+        new_frame = self.gst_to_opencv(sample, self.copy_mode, self.frame_pool)
         self._frame = new_frame
+        self._meta = meta
+        self.frame_seq = meta.seq
+
+        for func in self.frame_callbacks:
+            func(new_frame, meta)
 
         return Gst.FlowReturn.OK
 
     def stop(self):
-        self.video_pipe.set_state(Gst.State.NULL)
+        if self.supervisor is not None:
+            self.supervisor.stop()
 
-if __name__ == '__main__':
-    import time
-    # pipe = "admin:1234@117.17.159.143/normal1"
-    # pipe = "admin:1234@117.17.159.143/normal1"
-    pipe = '192.168.0.208/stream'
-
-
-    video = Video_Buffer(pipe = pipe)
-
-    time.sleep(1)
+async def show(video, window):
     import cv2
-    cv2.namedWindow("test")
-
-    while True:
-        print(video.frame_available())
-        if video.frame_available():
-            frames = video.get_frame()
-
-            cv2.imshow('test', frames)
-
-            if cv2.waitKey(1) & 0xFF == 27:
-                break
-        
-    cv2.destroyAllWindows()
-
+    async for frame, meta in video.frames(policy='latest'):
+        cv2.imshow(window, frame)
+        if cv2.waitKey(1) & 0xFF == 27:
+            break
 
 
+async def main(pipes):
+    # every camera is one Video_Buffer and one task on the same event loop
+    videos = [Video_Buffer(pipe=pipe, appsink_name=f'video_sink{i}') for i, pipe in enumerate(pipes)]
+    try:
+        await asyncio.gather(*(show(video, pipe) for video, pipe in zip(videos, pipes)))
+    finally:
+        for video in videos:
+            video.stop()
 
 
+if __name__ == '__main__':
+    import cv2
+    # pipe = "admin:1234@117.17.159.143/normal1"
+    pipes = sys.argv[1:] or ['192.168.0.208/stream']
 
+    asyncio.run(main(pipes))
+    cv2.destroyAllWindows()
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers for moving frames between GStreamer samples and NumPy arrays.
+
+copy modes used by Video_Buffer.gst_to_opencv
+    dup  : buf.extract_dup() into a new array every frame (old behaviour)
+    pool : map the buffer and copy into a recycled, preallocated array
+    view : map the buffer read-only and return a view on it, no copy.
+           The mapping is released when the last view is garbage collected.
+
+pixel formats (Video_Buffer pixel_format / output_caps)
+    BGR   : (H, W, 3) array
+    GRAY8 : (H, W) array
+    NV12  : (Y, UV) planes, (H, W) and (H/2, W/2, 2)
+    I420  : (Y, U, V) planes, (H, W), (H/2, W/2) and (H/2, W/2)
+Planes are views into one buffer with the strides and offsets GStreamer
+reports, rows may be padded.
+
+FrameMeta / SourceClock carry the source PTS and capture time of a frame
+through the relay into the outgoing buffers, LatencyTracker keeps recent
+per-stage latencies.
+ChangeGate decimates near-duplicate frames of static scenes before
+they are published.
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstVideo', '1.0')
+from gi.repository import Gst, GstVideo
+
+COPY_MODES = ('dup', 'pool', 'view')
+PIXEL_FORMATS = ('BGR', 'GRAY8', 'NV12', 'I420')
+
+
+class MappedSample:
+    """Keeps a sample and its read-only buffer mapping alive."""
+    def __init__(self, sample):
+        self.info = None
+        self.sample = sample
+        self.buffer = sample.get_buffer()
+        ok, info = self.buffer.map(Gst.MapFlags.READ)
+        if not ok:
+            raise RuntimeError("Failed to map sample buffer")
+        self.info = info
+
+    @property
+    def data(self):
+        return self.info.data
+
+    def unmap(self):
+        if self.info is not None:
+            self.buffer.unmap(self.info)
+            self.info = None
+
+    def __del__(self):
+        self.unmap()
+
+
+class SampleArray(np.ndarray):
+    """ndarray over mapped GStreamer memory.
+
+    Holds a reference to the MappedSample it was built from, so the buffer
+    stays mapped for as long as the array (or any view of it) is alive.
+    """
+    def __array_finalize__(self, obj):
+        # views keep their parent alive through .base, results of ufuncs
+        # own their memory, so neither needs its own reference
+        self._mapping = None
+
+
+class FramePool:
+    """Fixed number of preallocated frames handed out round-robin.
+
+    A frame returned by copy() stays valid until `size` newer frames
+    have been copied into the pool.
+    """
+    def __init__(self, size=4):
+        self.size = size
+        self._frames = [None] * size
+        self._index = 0
+        self.allocations = 0
+        self.copies = 0
+
+    def next_frame(self, shape, dtype=np.uint8):
+        frame = self._frames[self._index]
+        if frame is None or frame.shape != shape or frame.dtype != dtype:
+            frame = np.empty(shape, dtype=dtype)
+            self._frames[self._index] = frame
+            self.allocations += 1
+        self._index = (self._index + 1) % self.size
+        return frame
+
+    def copy(self, src):
+        frame = self.next_frame(src.shape, src.dtype)
+        np.copyto(frame, src)
+        self.copies += 1
+        return frame
+
+
+def output_caps(pixel_format='BGR', width=None, height=None):
+    """Launch string fragment from decoded video to pixel_format.
+
+    Only scales when a width or height is given, otherwise the source's
+    native size is kept. videoconvert passes buffers through untouched
+    when the decoder already outputs pixel_format (e.g. I420 from avdec_h264).
+    """
+    if pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"Unknown pixel format {pixel_format!r}, expected one of {PIXEL_FORMATS}")
+    scale = ''
+    if width or height:
+        size = ','.join(f'{name}={value}' for name, value in (('width', width), ('height', height)) if value)
+        scale = f'! videoscale ! video/x-raw,{size} '
+    return f'{scale}! videoconvert ! video/x-raw,format={pixel_format} '
+
+
+def sample_shape(sample):
+    structure = sample.get_caps().get_structure(0)
+    return structure.get_value('height'), structure.get_value('width'), 3
+
+
+def _video_info(caps):
+    if hasattr(GstVideo.VideoInfo, 'new_from_caps'):
+        return GstVideo.VideoInfo.new_from_caps(caps)
+    info = GstVideo.VideoInfo()
+    info.from_caps(caps)
+    return info
+
+
+# caps string -> (format, planes, buffer size) for the last few caps seen
+_layouts = {}
+
+
+def caps_layout(caps):
+    """(format, [(offset, shape, strides), ...], size) of raw video buffers with these caps."""
+    key = caps.to_string()
+    layout = _layouts.get(key)
+    if layout is None:
+        info = _video_info(caps)
+        pixel_format = caps.get_structure(0).get_value('format')
+        width, height = info.width, info.height
+        half = ((height + 1) // 2, (width + 1) // 2)
+        if pixel_format == 'GRAY8':
+            shapes = [((height, width), (1,))]
+        elif pixel_format == 'NV12':
+            shapes = [((height, width), (1,)), (half + (2,), (2, 1))]
+        elif pixel_format == 'I420':
+            shapes = [((height, width), (1,)), (half, (1,)), (half, (1,))]
+        elif pixel_format == 'BGR':
+            shapes = [((height, width, 3), (3, 1))]
+        else:
+            raise ValueError(f"Unsupported pixel format {pixel_format}, expected one of {PIXEL_FORMATS}")
+        planes = [(info.offset[i], shape, (info.stride[i],) + strides)
+                  for i, (shape, strides) in enumerate(shapes)]
+        if len(_layouts) > 16:
+            _layouts.clear()
+        layout = _layouts[key] = (pixel_format, planes, info.size)
+    return layout
+
+
+def sample_layout(sample):
+    """(format, [(offset, shape, strides), ...]) of the planes in a raw video sample."""
+    pixel_format, planes, size = caps_layout(sample.get_caps())
+    layout = (pixel_format, planes)
+
+    # decoders that pad planes differently from the caps defaults say so in a GstVideoMeta
+    meta = GstVideo.buffer_get_video_meta(sample.get_buffer())
+    if meta is not None:
+        pixel_format, planes = layout
+        planes = [(meta.offset[i], shape, (meta.stride[i],) + strides[1:])
+                  for i, (offset, shape, strides) in enumerate(planes)]
+        layout = (pixel_format, planes)
+    return layout
+
+
+def _planes(data, planes, cls=np.ndarray):
+    return [np.ndarray.__new__(cls, shape, dtype=np.uint8, buffer=data, offset=offset, strides=strides)
+            for offset, shape, strides in planes]
+
+
+def sample_to_array(sample, mode='dup', pool=None):
+    """Convert a raw video sample into uint8 arrays.
+
+    BGR and GRAY8 give one (H, W, 3) / (H, W) array, NV12 and I420 a tuple
+    of plane arrays, see the module docstring.
+    """
+    pixel_format, planes = sample_layout(sample)
+
+    if mode == 'dup':
+        buf = sample.get_buffer()
+        views = _planes(buf.extract_dup(0, buf.get_size()), planes)
+        return views[0] if len(views) == 1 else tuple(views)
+
+    mapping = MappedSample(sample)
+    views = _planes(mapping.data, planes, SampleArray)
+    for view in views:
+        view._mapping = mapping
+
+    if mode == 'view':
+        return views[0] if len(views) == 1 else tuple(views)
+    if mode == 'pool':
+        if pool is None:
+            raise ValueError("pool mode needs a FramePool")
+        if len(views) == 1:
+            frame = pool.copy(views[0])
+        else:
+            # one copy of the whole buffer, planes stay views into it
+            raw = np.frombuffer(mapping.data, dtype=np.uint8)
+            frame = tuple(_planes(pool.copy(raw), planes))
+            del raw
+        del views
+        mapping.unmap()
+        return frame
+
+    del views
+    mapping.unmap()
+    raise ValueError(f"Unknown copy mode {mode!r}, expected one of {COPY_MODES}")
+
+
+def frame_caps(frame, fps=30):
+    """appsrc caps for a BGR (H, W, 3) or GRAY8 (H, W) frame, or NV12 / I420 planes."""
+    if isinstance(frame, tuple):
+        pixel_format = {2: 'NV12', 3: 'I420'}.get(len(frame))
+        if pixel_format is None:
+            raise ValueError(f"Cannot push {len(frame)} planes, expected NV12 (Y, UV) or I420 (Y, U, V)")
+        frame = frame[0]
+    elif frame.ndim == 2:
+        pixel_format = 'GRAY8'
+    elif frame.ndim == 3 and frame.shape[2] == 3:
+        pixel_format = 'BGR'
+    else:
+        raise ValueError(f"Cannot push a frame of shape {frame.shape}, expected (H, W, 3) or (H, W)")
+    height, width = frame.shape[:2]
+    return Gst.Caps.from_string(
+        f'video/x-raw,format={pixel_format},width={width},height={height},framerate={fps}/1')
+
+
+def frame_key(frame):
+    """Shapes and dtype of a frame or of its planes, changes whenever its caps would."""
+    if isinstance(frame, tuple):
+        return tuple(plane.shape for plane in frame), len(frame)
+    return frame.shape, frame.dtype
+
+
+class AppsrcCaps:
+    """Keeps one media's appsrc caps in line with the size / format of the frames pushed."""
+    def __init__(self, fps=30):
+        self.fps = fps
+        self.key = None
+
+    def update(self, src, frame):
+        key = frame_key(frame)
+        if key != self.key:
+            src.set_property('caps', frame_caps(frame, self.fps))
+            self.key = key
+
+
+class PushBufferPool:
+    """Pre-sized Gst.Buffers for appsrc, filled in place from numpy frames.
+
+    Replaces frame.tostring() + Gst.Buffer.new_allocate() + buf.fill(),
+    which copied every frame twice and allocated a new buffer each time.
+    Buffers go back to the pool once downstream releases them. NV12 / I420
+    planes are copied into the default GStreamer layout for their caps.
+    """
+    def __init__(self, caps=None, min_buffers=2, max_buffers=0):
+        self.caps = caps
+        self.min_buffers = min_buffers
+        self.max_buffers = max_buffers
+        self.pool = None
+        self.size = 0
+        self._planar_key = None
+        self._planar_layout = None
+
+    def _configure(self, size):
+        if self.pool is not None:
+            self.pool.set_active(False)
+        self.pool = Gst.BufferPool.new()
+        config = self.pool.get_config()
+        Gst.BufferPool.config_set_params(config, self.caps, size, self.min_buffers, self.max_buffers)
+        self.pool.set_config(config)
+        self.pool.set_active(True)
+        self.size = size
+
+    def _write_planes(self, data, frame):
+        for plane, src in zip(_planes(data, self._planar_layout[1]), frame):
+            np.copyto(plane, src)
+
+    def frame_to_buffer(self, frame):
+        if isinstance(frame, tuple):
+            key = frame_key(frame)
+            if key != self._planar_key:
+                self._planar_layout = caps_layout(frame_caps(frame))
+                self._planar_key = key
+            return self._fill(self._planar_layout[2], lambda data: self._write_planes(data, frame))
+
+        frame = np.ascontiguousarray(frame)
+        return self._fill(frame.nbytes, lambda data: np.copyto(
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=data), frame))
+
+    def _fill(self, size, write):
+        if self.pool is None or size != self.size:
+            self._configure(size)
+
+        ret, buf = self.pool.acquire_buffer(None)
+        if ret != Gst.FlowReturn.OK:
+            raise RuntimeError(f"Failed to acquire buffer from pool: {ret}")
+
+        ok, info = buf.map(Gst.MapFlags.WRITE)
+        if not ok:
+            raise RuntimeError("Failed to map pool buffer for writing")
+        try:
+            write(info.data)
+        except (TypeError, ValueError):
+            # older gst-python hands out read-only map data
+            buf.unmap(info)
+            info = None
+            scratch = np.zeros(size, dtype=np.uint8)
+            write(scratch)
+            buf.fill(0, scratch.tobytes())
+        finally:
+            if info is not None:
+                buf.unmap(info)
+        return buf
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.set_active(False)
+            self.pool = None
+
+
+# GstReferenceTimestampMeta caps used on outgoing buffers
+CAPTURE_TIMESTAMP_CAPS = 'timestamp/x-unix'
+PUSH_TIMESTAMP_CAPS = 'timestamp/x-relay-push'
+# rtspsrc add-reference-timestamp-meta (RTCP sender report clock)
+NTP_TIMESTAMP_CAPS = 'timestamp/x-ntp'
+NTP_UNIX_OFFSET = 2208988800 * 1000000000
+
+
+class FrameMeta:
+    """Timing that travels with a frame from the source to the outgoing buffer.
+
+    pts / duration are the source buffer's in ns (None if unknown),
+    capture_time is wall clock ns (camera NTP time when the source sends
+    RTCP sender reports, otherwise arrival in Python), stages holds
+    time.monotonic() marks of the relay stages the frame went through.
+    """
+    def __init__(self, seq=0, pts=None, duration=None, capture_time=None):
+        self.seq = seq
+        self.pts = pts
+        self.duration = duration
+        self.capture_time = capture_time if capture_time is not None else time.time_ns()
+        self.decode_latency = None
+        self.stages = {}
+
+    def mark(self, stage):
+        self.stages[stage] = time.monotonic()
+
+    def elapsed(self, start, end):
+        if start in self.stages and end in self.stages:
+            return self.stages[end] - self.stages[start]
+        return None
+
+
+class DecodeSampler:
+    """Drops frames around a decoder for consumers that need a low rate.
+
+    keyframes_only : delta units are dropped before the decoder, only
+                     keyframes are decoded at all
+    stride         : keep every stride-th decoded frame
+    target_fps     : keep at most target_fps decoded frames per second
+
+    Delta frames are references for the next ones, so stride / target_fps
+    can only drop after the decoder; that still saves the scale, colour
+    conversion and copy of every dropped frame. avdec_* is also told to
+    skip non-reference frames in that case, nothing downstream needs them.
+    """
+    def __init__(self, keyframes_only=False, stride=1, target_fps=None):
+        self.keyframes_only = keyframes_only
+        self.stride = max(int(stride), 1)
+        self.interval = int(Gst.SECOND / target_fps) if target_fps else 0
+        self.dropped_encoded = 0
+        self.dropped_decoded = 0
+        self._count = 0
+        self._last = None
+
+    @property
+    def active(self):
+        return self.keyframes_only or self.stride > 1 or self.interval > 0
+
+    def attach(self, decoder):
+        """Probe a decoder element or decodebin, call again after every pipeline rebuild."""
+        self._count = 0
+        self._last = None
+        if self.keyframes_only:
+            decoder.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, self.on_encoded)
+        if self.stride > 1 or self.interval:
+            src = decoder.get_static_pad('src')
+            if src is not None:
+                src.add_probe(Gst.PadProbeType.BUFFER, self.on_decoded)
+            else:
+                # decodebin, src pads and the actual decoder show up later
+                decoder.connect('pad-added', lambda element, pad: pad.add_probe(
+                    Gst.PadProbeType.BUFFER, self.on_decoded))
+                decoder.connect('deep-element-added', lambda bin, sub, element: self.skip_nonref(element))
+            self.skip_nonref(decoder)
+
+    def skip_nonref(self, element):
+        factory = element.get_factory()
+        if factory is not None and factory.get_name().startswith('avdec_') \
+                and element.find_property('skip-frame') is not None:
+            Gst.util_set_object_arg(element, 'skip-frame', '1')
+
+    def on_encoded(self, pad, info):
+        if info.get_buffer().has_flags(Gst.BufferFlags.DELTA_UNIT):
+            self.dropped_encoded += 1
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def on_decoded(self, pad, info):
+        self._count += 1
+        if self._count % self.stride:
+            self.dropped_decoded += 1
+            return Gst.PadProbeReturn.DROP
+        if self.interval:
+            pts = _clock_time(info.get_buffer().pts)
+            now = pts if pts is not None else time.monotonic_ns()
+            if self._last is not None and 0 <= now - self._last < self.interval:
+                self.dropped_decoded += 1
+                return Gst.PadProbeReturn.DROP
+            self._last = now
+        return Gst.PadProbeReturn.OK
+
+
+class ChangeGate:
+    """Lets near-duplicate frames of a static scene through at a lower rate.
+
+    Every frame is reduced to a small luma thumbnail (every step-th pixel
+    of the Y / GRAY8 plane, the green channel of BGR) and compared with the
+    thumbnail of the last frame let through. While the mean absolute
+    difference stays at or below threshold (0-255) only static_fps frames
+    per second pass. Anything above it passes right away and keeps the full
+    rate for hold seconds.
+
+    Frames that pass keep their own source PTS, the skipped ones just leave
+    a gap of up to 1 / static_fps plus one source frame. static_fps must be
+    at least 2 so that gap stays well within the 1 s SourceClock max_gap
+    and the outgoing timeline is not rebased on every static frame.
+    """
+    def __init__(self, threshold=2.0, static_fps=2, hold=1.0, size=64):
+        if static_fps < 2:
+            raise ValueError("ChangeGate static_fps must be at least 2, longer gaps restart the SourceClock timeline")
+        self.threshold = threshold
+        self.interval = int(Gst.SECOND / static_fps)
+        self.hold = int(hold * Gst.SECOND)
+        self.size = size
+        self.passed = 0
+        self.skipped = 0
+        self._reference = None
+        self._last = None
+        self._moving_until = 0
+
+    def thumbnail(self, frame):
+        luma = frame[0] if isinstance(frame, tuple) else frame
+        step = max(luma.shape[1] // self.size, 1)
+        thumb = luma[::step, ::step]
+        if thumb.ndim == 3:
+            thumb = thumb[..., 1]
+        # small copy, never keeps a view of mapped memory
+        return thumb.astype(np.int16)
+
+    def check(self, frame, meta=None):
+        """True if frame should be published."""
+        now = meta.pts if meta is not None and meta.pts is not None else time.monotonic_ns()
+        thumb = self.thumbnail(frame)
+        reference = self._reference
+        if reference is None or reference.shape != thumb.shape \
+                or np.abs(thumb - reference).mean() > self.threshold:
+            self._moving_until = now + self.hold
+        elif now < self._moving_until:
+            pass
+        elif self._last is not None and 0 <= now - self._last < self.interval:
+            self.skipped += 1
+            return False
+        self._reference = thumb
+        self._last = now
+        self.passed += 1
+        return True
+
+
+def element_has_property(factory_name, name):
+    element = Gst.ElementFactory.make(factory_name, None)
+    return element is not None and element.find_property(name) is not None
+
+
+def _clock_time(value):
+    return None if value == Gst.CLOCK_TIME_NONE else value
+
+
+def sample_meta(sample, seq=0):
+    """FrameMeta for a sample pulled from an appsink."""
+    buf = sample.get_buffer()
+    pts = _clock_time(buf.pts)
+    meta = FrameMeta(seq, pts, _clock_time(buf.duration))
+
+    ntp = buf.get_reference_timestamp_meta(Gst.Caps.from_string(NTP_TIMESTAMP_CAPS))
+    if ntp is not None:
+        meta.capture_time = ntp.timestamp - NTP_UNIX_OFFSET
+    meta.mark('decoded')
+    return meta
+
+
+def decode_latency(sample, element):
+    """Seconds between the sample's running time and the element's clock now.
+
+    Covers jitterbuffer, depay and decode since the buffer was timestamped
+    by rtspsrc.
+    """
+    pts = _clock_time(sample.get_buffer().pts)
+    clock = element.get_clock()
+    if pts is None or clock is None:
+        return None
+    running_time = sample.get_segment().to_running_time(Gst.Format.TIME, pts)
+    if running_time == Gst.CLOCK_TIME_NONE:
+        return None
+    return (clock.get_time() - element.get_base_time() - running_time) / Gst.SECOND
+
+
+class SourceClock:
+    """Stamps the buffers pushed into one media from the frames' source PTS.
+
+    The media timeline starts at 0 on its first frame. When the source PTS
+    goes backwards or jumps by more than max_gap (reconnect, new session)
+    the timeline continues from the last pushed frame instead. Frames
+    without a source PTS fall back to the previous counter based PTS.
+    """
+    def __init__(self, default_duration, max_gap=Gst.SECOND):
+        self.default_duration = int(default_duration)
+        self.max_gap = max_gap
+        self.base_pts = None
+        self.last_pts = None
+        self.frames = 0
+        self._capture_caps = Gst.Caps.from_string(CAPTURE_TIMESTAMP_CAPS)
+        self._push_caps = Gst.Caps.from_string(PUSH_TIMESTAMP_CAPS)
+
+    def stamp(self, buf, meta=None):
+        duration = meta.duration if meta is not None and meta.duration else self.default_duration
+        next_pts = 0 if self.last_pts is None else self.last_pts + duration
+
+        if meta is None or meta.pts is None:
+            pts = next_pts
+        else:
+            if self.base_pts is None:
+                self.base_pts = meta.pts
+            pts = meta.pts - self.base_pts
+            if self.last_pts is not None and not 0 < pts - self.last_pts <= self.max_gap:
+                self.base_pts = meta.pts - next_pts
+                pts = next_pts
+
+        buf.pts = buf.dts = pts
+        buf.duration = duration
+        buf.offset = self.frames
+        self.last_pts = pts
+        self.frames += 1
+
+        if meta is not None:
+            buf.add_reference_timestamp_meta(self._capture_caps, meta.capture_time, Gst.CLOCK_TIME_NONE)
+        buf.add_reference_timestamp_meta(self._push_caps, time.time_ns(), Gst.CLOCK_TIME_NONE)
+        return buf
+
+
+def encoded_latency(buf):
+    """(encode, total) seconds for a buffer stamped by SourceClock, None if unknown."""
+    now = time.time_ns()
+    push = buf.get_reference_timestamp_meta(Gst.Caps.from_string(PUSH_TIMESTAMP_CAPS))
+    capture = buf.get_reference_timestamp_meta(Gst.Caps.from_string(CAPTURE_TIMESTAMP_CAPS))
+    return (
+        (now - push.timestamp) / 1e9 if push is not None else None,
+        (now - capture.timestamp) / 1e9 if capture is not None else None,
+    )
+
+
+class LatencyTracker:
+    """Most recent latencies per stage, in seconds.
+
+    Every sample is also observed into histogram (e.g. a metrics.Histogram
+    with a 'stage' label) when one is given, with the extra labels.
+    """
+    def __init__(self, window=300, histogram=None, **labels):
+        self.window = window
+        self.samples = {}
+        self.histogram = histogram
+        self.labels = labels
+
+    def record(self, stage, seconds):
+        if seconds is None:
+            return
+        if self.histogram is not None:
+            self.histogram.observe(seconds, stage=stage, **self.labels)
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, stage, q):
+        samples = sorted(self.samples.get(stage, ()))
+        if not samples:
+            return None
+        return samples[min(int(len(samples) * q / 100), len(samples) - 1)]
+
+    def summary(self):
+        parts = []
+        for stage in self.samples:
+            p50 = self.percentile(stage, 50)
+            p99 = self.percentile(stage, 99)
+            parts.append(f'{stage} p50 {p50 * 1000:.1f}ms p99 {p99 * 1000:.1f}ms')
+        return ', '.join(parts)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local videotestsrc ! x264enc RTSP source, stands in for a camera when
+testing the relay on one machine.
+
+    python3 local_rtsp_source.py --port 8555 --stream_uri /test
+    python3 gst_rtsp_server.py --address 127.0.0.1 --passthrough \\
+        --rtsp_source rtsp://127.0.0.1:8555/test
+
+With --burn_timestamp every frame carries a frame counter and its capture
+time as a row of black / white blocks in the top left corner, read back
+with read_stamp() to measure glass-to-glass latency.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstRtspServer', '1.0')
+from gi.repository import Gst, GstRtspServer, GObject
+
+from gst_frame import PushBufferPool
+
+STAMP_BLOCK = 16
+STAMP_ROWS = 2
+STAMP_COLS = 32
+STAMP_TIME_MASK = (1 << 48) - 1
+
+
+def burn_stamp(luma, counter, timestamp_us):
+    """Write a 16 bit counter and 48 bit microsecond timestamp into a luma plane."""
+    value = (counter & 0xFFFF) << 48 | (timestamp_us & STAMP_TIME_MASK)
+    bits = (np.uint64(value) >> np.arange(STAMP_ROWS * STAMP_COLS, dtype=np.uint64)) & np.uint64(1)
+    blocks = np.where(bits, 235, 16).astype(np.uint8).reshape(STAMP_ROWS, STAMP_COLS)
+    luma[:STAMP_ROWS * STAMP_BLOCK, :STAMP_COLS * STAMP_BLOCK] = \
+        np.repeat(np.repeat(blocks, STAMP_BLOCK, axis=0), STAMP_BLOCK, axis=1)
+
+
+def read_stamp(image):
+    """(counter, timestamp_us) from a BGR or gray frame stamped by burn_stamp."""
+    gray = image[..., 1] if image.ndim == 3 else image
+    half = STAMP_BLOCK // 2
+    centers = gray[half:STAMP_ROWS * STAMP_BLOCK:STAMP_BLOCK, half:STAMP_COLS * STAMP_BLOCK:STAMP_BLOCK]
+    value = 0
+    for i, bit in enumerate((centers > 128).ravel()):
+        if bit:
+            value |= 1 << i
+    return value >> 48, value & STAMP_TIME_MASK
+
+
+def stamp_age(timestamp_us):
+    """Seconds since a burnt in timestamp."""
+    return ((time.time_ns() // 1000 - timestamp_us) & STAMP_TIME_MASK) / 1e6
+
+
+def test_source_launch(width=1920, height=1080, fps=30, pattern='ball', overlay=True):
+    overlay = '! timeoverlay halignment=left valignment=top ' if overlay else ''
+    return f'( videotestsrc is-live=true pattern={pattern} ' \
+           f'! video/x-raw,width={width},height={height},framerate={fps}/1 ' \
+           f'{overlay}' \
+           '! videoconvert ! video/x-raw,format=I420 ' \
+           f'! x264enc speed-preset=ultrafast tune=zerolatency key-int-max={fps} ' \
+           '! rtph264pay config-interval=1 name=pay0 pt=96 )'
+
+
+class StampedSourceFactory(GstRtspServer.RTSPMediaFactory):
+    """appsrc test source with the capture time burnt into every frame."""
+    def __init__(self, width=1920, height=1080, fps=30, **properties):
+        super(StampedSourceFactory, self).__init__(**properties)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.duration = Gst.SECOND // fps
+        self.launch_string = 'appsrc name=source is-live=true format=GST_FORMAT_TIME ' \
+                             f'caps=video/x-raw,format=I420,width={width},height={height},framerate={fps}/1 ' \
+                             f'! x264enc speed-preset=ultrafast tune=zerolatency key-int-max={fps} ' \
+                             '! rtph264pay config-interval=1 name=pay0 pt=96'
+
+    def do_create_element(self, url):
+        return Gst.parse_launch(self.launch_string)
+
+    def do_configure(self, rtsp_media):
+        # I420 frame: gradient luma with a moving bar, neutral chroma
+        gradient = np.linspace(16, 235, self.width, dtype=np.uint8)
+        frame = np.full((self.height * 3 // 2, self.width), 128, dtype=np.uint8)
+        frame[:self.height] = gradient
+        state = {'frame': frame, 'gradient': gradient, 'count': 0, 'start': None,
+                 'pool': PushBufferPool()}
+        appsrc = rtsp_media.get_element().get_child_by_name('source')
+        appsrc.connect('need-data', self.on_need_data, state)
+
+    def on_need_data(self, src, length, state):
+        count = state['count']
+        if state['start'] is None:
+            state['start'] = time.monotonic()
+        # pace the live source at fps
+        delay = state['start'] + count / self.fps - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        frame = state['frame']
+        luma = frame[:self.height]
+        bar = (count * 8) % (self.width - 32)
+        luma[STAMP_ROWS * STAMP_BLOCK:, bar:bar + 32] = 235
+        burn_stamp(luma, count, time.time_ns() // 1000)
+        buf = state['pool'].frame_to_buffer(frame)
+        luma[STAMP_ROWS * STAMP_BLOCK:, bar:bar + 32] = state['gradient'][bar:bar + 32]
+
+        buf.pts = buf.dts = count * self.duration
+        buf.duration = self.duration
+        state['count'] = count + 1
+        src.emit('push-buffer', buf)
+
+
+def start_test_source(port=8555, stream_uri='/test', address='127.0.0.1', burn_timestamp=False, count=1,
+                      **launch_options):
+    """Serve a test pattern on rtsp://address:port/stream_uri, returns the server.
+
+    With count > 1 the sources are mounted on stream_uri0 .. stream_uri{count - 1}.
+    The GLib main loop must be running for the server to answer.
+    """
+    server = GstRtspServer.RTSPServer()
+    server.set_address(address)
+    server.set_service(str(port))
+    mounts = [stream_uri] if count == 1 else [f'{stream_uri}{i}' for i in range(count)]
+    for mount in mounts:
+        add_test_source(server, mount, burn_timestamp, **launch_options)
+    server.attach(None)
+    return server
+
+
+def add_test_source(server, stream_uri, burn_timestamp=False, **launch_options):
+    if burn_timestamp:
+        launch_options.pop('pattern', None)
+        launch_options.pop('overlay', None)
+        factory = StampedSourceFactory(**launch_options)
+    else:
+        factory = GstRtspServer.RTSPMediaFactory()
+        factory.set_launch(test_source_launch(**launch_options))
+    factory.set_shared(True)
+    server.get_mount_points().add_factory(stream_uri, factory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", default="127.0.0.1", help="address to bind the rtsp server to")
+    parser.add_argument("--port", default=8555, help="port to stream video", type=int)
+    parser.add_argument("--stream_uri", default="/test", help="rtsp video stream uri")
+    parser.add_argument("--width", default=1920, type=int)
+    parser.add_argument("--height", default=1080, type=int)
+    parser.add_argument("--fps", default=30, type=int)
+    parser.add_argument("--pattern", default="ball", help="videotestsrc pattern")
+    parser.add_argument("--burn_timestamp", action="store_true",
+                        help="burn frame counter and capture time into each frame")
+    parser.add_argument("--count", default=1, type=int,
+                        help="number of independent sources, mounted on stream_uri0, stream_uri1, ...")
+    opt = parser.parse_args()
+
+    Gst.init(None)
+    server = start_test_source(opt.port, opt.stream_uri, opt.address, opt.burn_timestamp, opt.count,
+                               width=opt.width, height=opt.height, fps=opt.fps, pattern=opt.pattern)
+    suffix = '' if opt.count == 1 else f'[0-{opt.count - 1}]'
+    print(f"Test source on rtsp://{opt.address}:{opt.port}{opt.stream_uri}{suffix}")
+
+    try:
+        GObject.MainLoop().run()
+    except KeyboardInterrupt:
+        print("Exiting...")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Minimal Prometheus text-format metrics for the relay.
+
+Updating a metric on the hot path is a dict lookup and an add under the
+GIL. Values that already live elsewhere (queue depth, session count) are
+registered with track() and only read when the endpoint is scraped.
+
+    start_http_server(9100)   # curl http://127.0.0.1:9100/metrics
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.functions = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def track(self, func, **labels):
+        """Read the value from func() at scrape time."""
+        self.functions[self._key(labels)] = func
+
+    def untrack(self, **labels):
+        self.functions.pop(self._key(labels), None)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        values = dict(self.values)
+        for key, func in list(self.functions.items()):
+            try:
+                values[key] = func()
+            except Exception:
+                continue
+        for key, value in values.items():
+            yield f'{self.name}{self._labels(key)} {value}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets or (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            # per-bucket counts, sum, count
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{self._labels(key, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{self._labels(key)} {total}'
+            yield f'{self.name}_count{self._labels(key)} {count}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+    def export(self, **labels):
+        """Current values of the series matching labels, by metric name.
+
+        Picklable, so another process (shm_relay's capture process) can
+        send them to the one serving the endpoint, which restore()s them.
+        Tracked values are read once and exported as plain values.
+        """
+        exported = {}
+        for metric in self.metrics:
+            if not set(labels) <= set(metric.labelnames):
+                continue
+            values = dict(metric.values)
+            for key, func in list(metric.functions.items()):
+                try:
+                    values[key] = func()
+                except Exception:
+                    continue
+            wanted = [(metric.labelnames.index(name), str(value)) for name, value in labels.items()]
+            matching = {key: value for key, value in values.items()
+                        if all(key[index] == label for index, label in wanted)}
+            if matching:
+                exported[metric.name] = matching
+        return exported
+
+    def restore(self, exported):
+        """Take over the series of an export(), replacing this registry's values for them."""
+        for metric in self.metrics:
+            if metric.name in exported:
+                metric.values.update(exported[metric.name])
+
+
+REGISTRY = Registry()
+
+# relay metrics shared by gst_rtsp_server.py and cv_rtsp_server.py
+FRAMES_DECODED = REGISTRY.counter(
+    'relay_frames_decoded_total', 'Frames decoded from the source', ['stream'])
+FRAMES_PUSHED = REGISTRY.counter(
+    'relay_frames_pushed_total', 'Frames pushed into RTSP media appsrcs', ['stream'])
+FRAMES_DROPPED = REGISTRY.counter(
+    'relay_frames_dropped_total', 'Frames dropped before a media could push them', ['stream'])
+QUEUE_DEPTH = REGISTRY.gauge(
+    'relay_queue_depth', 'Frames waiting in the most backed up media subscription', ['stream'])
+PUSH_RESULTS = REGISTRY.counter(
+    'relay_push_buffer_total', 'appsrc push-buffer flow returns', ['stream', 'result'])
+STAGE_LATENCY = REGISTRY.histogram(
+    'relay_stage_latency_seconds', 'Per-frame latency of each relay stage', ['stream', 'stage'])
+BUFFER_BYTES = REGISTRY.gauge(
+    'relay_buffer_bytes', 'Bytes of decoded frames held in the stream frame hub', ['stream'])
+RTSP_CLIENTS = REGISTRY.gauge(
+    'relay_rtsp_clients', 'Connected RTSP clients')
+RTSP_SESSIONS = REGISTRY.gauge(
+    'relay_rtsp_sessions', 'Sessions in the RTSP session pool')
+ENCODER_LEVEL = REGISTRY.gauge(
+    'relay_encoder_level', 'Step on the adaptive encoder ladder, 0 is full quality', ['stream'])
+RECONNECTS = REGISTRY.counter(
+    'relay_source_reconnects_total', 'Source pipeline restarts after ERROR / EOS / stale frames', ['stream'])
+FRAMES_UNCHANGED = REGISTRY.counter(
+    'relay_frames_unchanged_total', 'Near-duplicate frames held back by the change gate', ['stream'])
+SOURCE_UP = REGISTRY.gauge(
+    'relay_source_up', '1 while the source pipeline is delivering frames', ['stream'])
+WORKER_DROPS = REGISTRY.counter(
+    'relay_worker_frames_dropped_total', 'Frames dropped between the --workers processes, by stage',
+    ['stream', 'stage'])
+SOURCE_RECOVERY = REGISTRY.histogram(
+    'relay_source_recovery_seconds', 'Time from losing a source to its first frame again', ['stream'],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, address='127.0.0.1', registry=REGISTRY):
+    """Serve registry on http://address:port/metrics from a daemon thread."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((address, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
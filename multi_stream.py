@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Read several RTSP cameras as one (N, H, W, 3) batch for batched inference.
+
+    reader = MultiStreamReader(['192.168.0.10/stream', '192.168.0.11/stream'])
+    while True:
+        batch = reader.read(timeout=1.0)
+        boxes = model(batch.frames[batch.valid])
+
+Every camera is a gst_client.Video_Buffer in view mode, so the only copy
+of a frame is the one into its slot of the preallocated batch.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from gst_client import Video_Buffer
+
+
+class Batch:
+    """One preallocated batch, reused by MultiStreamReader.read().
+
+    frames        : (N, H, W, 3) uint8, contiguous
+    valid         : (N,) bool, slot holds a frame within tolerance of ref_time
+    seqs          : (N,) int64, Video_Buffer frame seq of each slot, 0 if never filled
+    capture_times : (N,) int64, wall clock ns of each slot's frame
+    ref_time      : wall clock ns the batch was aligned to
+    """
+    def __init__(self, count, height, width):
+        self.frames = np.zeros((count, height, width, 3), dtype=np.uint8)
+        self.valid = np.zeros(count, dtype=bool)
+        self.seqs = np.zeros(count, dtype=np.int64)
+        self.capture_times = np.zeros(count, dtype=np.int64)
+        self.ref_time = 0
+
+    @property
+    def stale(self):
+        return ~self.valid
+
+
+class MultiStreamReader:
+    """N Video_Buffers assembled into timestamp aligned batches.
+
+    Each camera keeps its last `history` frames (views on the decoded
+    buffers, not copies). read() aligns the batch to the newest capture
+    time among the cameras that are not stale and picks, per camera, the
+    frame closest to it. Slots whose best frame is further than tolerance
+    seconds away, older than stale_after seconds, or of another size are
+    marked invalid and keep their previous content.
+
+    read() cycles through `buffers` batches so the caller can run
+    inference on one while the next is being filled; a Batch is
+    overwritten `buffers` reads later.
+    """
+    def __init__(self, pipes, height=1080, width=1920, tolerance=0.05, stale_after=1.0, history=3,
+                 buffers=2):
+        self.pipes = list(pipes)
+        self.tolerance = int(tolerance * 1e9)
+        self.stale_after = int(stale_after * 1e9)
+        self.batches = [Batch(len(self.pipes), height, width) for _ in range(buffers)]
+        self._index = 0
+        self._history = [deque(maxlen=history) for _ in self.pipes]
+        self._cond = threading.Condition()
+        self._updates = 0
+        self._read_updates = 0
+
+        self.videos = []
+        for i, pipe in enumerate(self.pipes):
+            video = Video_Buffer(pipe=pipe, appsink_name=f'video_sink{i}', copy_mode='view',
+                                 width=width, height=height)
+            video.add_frame_callback(self._make_callback(i))
+            self.videos.append(video)
+
+    def _make_callback(self, index):
+        history = self._history[index]
+
+        def on_frame(frame, meta):
+            with self._cond:
+                history.append((frame, meta))
+                self._updates += 1
+                self._cond.notify_all()
+        return on_frame
+
+    def _reference_time(self, latest, now):
+        fresh = [meta.capture_time for frame, meta in latest
+                 if meta is not None and now - meta.capture_time <= self.stale_after]
+        return max(fresh) if fresh else None
+
+    def read(self, timeout=None):
+        """Next aligned Batch, waits up to timeout for any camera to deliver a new frame."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._updates > self._read_updates, timeout)
+            self._read_updates = self._updates
+            histories = [list(history) for history in self._history]
+
+        batch = self.batches[self._index]
+        self._index = (self._index + 1) % len(self.batches)
+
+        now = time.time_ns()
+        ref_time = self._reference_time([h[-1] if h else (None, None) for h in histories], now)
+        batch.ref_time = ref_time or 0
+        batch.valid[:] = False
+        if ref_time is None:
+            return batch
+
+        for i, history in enumerate(histories):
+            if not history:
+                continue
+            frame, meta = min(history, key=lambda item: abs(item[1].capture_time - ref_time))
+            if abs(meta.capture_time - ref_time) > self.tolerance or frame.shape != batch.frames.shape[1:]:
+                continue
+            if batch.seqs[i] != meta.seq:
+                np.copyto(batch.frames[i], frame)
+                batch.seqs[i] = meta.seq
+                batch.capture_times[i] = meta.capture_time
+            batch.valid[i] = True
+        return batch
+
+    def __iter__(self):
+        while True:
+            yield self.read()
+
+    def release(self):
+        for video in self.videos:
+            video.stop()
+        with self._cond:
+            for history in self._history:
+                history.clear()
+
+
+if __name__ == '__main__':
+    import sys
+
+    reader = MultiStreamReader(sys.argv[1:] or ['192.168.0.208/stream'])
+    try:
+        for batch in reader:
+            print(f'ref {batch.ref_time} valid {batch.valid.astype(int)} seqs {batch.seqs}')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.release()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keeps source pipelines running: reconnect with exponential backoff and
+jitter, a stale-frame watchdog and time-to-recover metrics.
+
+SourceSupervisor watches the pipeline bus from its own thread
+(timed_pop_filtered), so it works with or without a GLib main loop and
+never stacks signal watches. A failed source is restarted in place
+(NULL -> PLAYING on the same graph); only after rebuild_after failed
+attempts in a row is the launch string parsed again.
+"""
+import random
+import threading
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+import metrics
+
+
+class Backoff:
+    """Exponential backoff, each delay is shortened by up to `jitter` of itself.
+
+    The jitter keeps many relays that lost the same camera (or a whole
+    site) from retrying in lockstep.
+    """
+    def __init__(self, initial=0.5, maximum=30.0, factor=2.0, jitter=0.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
+
+
+class SourceSupervisor:
+    """Builds, plays and restarts one source pipeline.
+
+    setup(pipeline) is called after every (re)build to look up and connect
+    the appsinks. The owner calls frame_arrived() from its new-sample
+    callback, which is how recovery and staleness are detected. on_stale()
+    is called when no frame arrived for stale_after seconds, right before
+    the pipeline is restarted.
+    """
+    def __init__(self, launch, setup, name, backoff=None, stale_after=5.0, rebuild_after=3,
+                 on_stale=None):
+        self.launch = launch
+        self.setup = setup
+        self.name = name
+        self.backoff = backoff or Backoff()
+        self.stale_after = stale_after
+        self.rebuild_after = rebuild_after
+        self.on_stale = on_stale
+        self.pipeline = None
+        self.failures = 0
+        self.restarts = 0
+        self.rebuilds = 0
+        # monotonic time the source went down, None while it is delivering frames
+        self.down_since = None
+        self.last_frame = None
+        self.stale = False
+        # True from the first frame after (re)connecting until the source is lost
+        self.up = False
+        self._started = None
+        self._stop = threading.Event()
+        self._thread = None
+        metrics.SOURCE_UP.set(0, stream=name)
+
+    def start(self):
+        self._build()
+        self._play()
+        self._thread = threading.Thread(target=self._watch, name=f'supervisor {self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._teardown()
+
+    def frame_arrived(self):
+        self.last_frame = time.monotonic()
+        if not self.up or self.down_since is not None or self.stale:
+            self._recovered()
+
+    def _recovered(self):
+        down_since, self.down_since = self.down_since, None
+        self.up = True
+        self.stale = False
+        self.failures = 0
+        self.backoff.reset()
+        metrics.SOURCE_UP.set(1, stream=self.name)
+        if down_since is not None:
+            seconds = self.last_frame - down_since
+            metrics.SOURCE_RECOVERY.observe(seconds, stream=self.name)
+            print(f"{self.name}: recovered after {seconds:.1f}s")
+
+    def _build(self):
+        self._teardown()
+        self.pipeline = Gst.parse_launch(self.launch)
+        self.setup(self.pipeline)
+
+    def _teardown(self):
+        if self.pipeline is not None:
+            self.pipeline.set_state(Gst.State.NULL)
+            self.pipeline = None
+
+    def _play(self):
+        self._started = time.monotonic()
+        return self.pipeline.set_state(Gst.State.PLAYING) != Gst.StateChangeReturn.FAILURE
+
+    def _watch(self):
+        check = Gst.SECOND // 2
+        while not self._stop.is_set():
+            bus = self.pipeline.get_bus()
+            message = bus.timed_pop_filtered(check, Gst.MessageType.ERROR | Gst.MessageType.EOS)
+            if self._stop.is_set():
+                break
+            if message is not None:
+                if message.type == Gst.MessageType.ERROR:
+                    error, debug = message.parse_error()
+                    self._restart(f"error: {error.message}")
+                else:
+                    self._restart("end of stream")
+            elif self._is_stale():
+                self.stale = True
+                if self.on_stale is not None:
+                    self.on_stale()
+                self._restart(f"no frames for {self.stale_after}s")
+
+    def _is_stale(self):
+        last = max(self.last_frame or 0, self._started or 0)
+        return time.monotonic() - last > self.stale_after
+
+    def _restart(self, reason):
+        print(f"Disconnect RTSP {self.name} ({reason})")
+        metrics.RECONNECTS.inc(stream=self.name)
+        self.up = False
+        metrics.SOURCE_UP.set(0, stream=self.name)
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+
+        while not self._stop.is_set():
+            self.pipeline.set_state(Gst.State.NULL)
+            delay = self.backoff.next()
+            print(f"{self.name}: reconnecting in {delay:.1f}s")
+            if self._stop.wait(delay):
+                return
+            self.failures += 1
+            self.restarts += 1
+            if self.failures > self.rebuild_after:
+                # the graph itself may be broken (e.g. stuck element), start over
+                self.failures = 0
+                self.rebuilds += 1
+                self._build()
+            if self._play():
+                return
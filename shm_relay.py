@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Capture / process / serve split over shared memory, so per-frame Python
+work runs on as many cores as there are workers instead of sharing the
+GIL with the appsink and appsrc callbacks.
+
+    capture process : Video_Buffer decode, frames copied into ring `in`
+    worker pool     : hook(frame) from ring `in`, result written to ring `out`
+    serve process   : the GstServer, copies results out of ring `out` into its FrameHub
+
+Frames never go through a pipe, only (seq, pts, capture_time)
+descriptors do. Every stage is a separate interpreter, started with the
+spawn method because GStreamer does not survive fork.
+"""
+import importlib
+import multiprocessing as mp
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics
+
+# per-slot header, int64 each
+HEADER_FIELDS = ('seq', 'height', 'width', 'channels', 'pts', 'capture_time')
+# header seq while the writer is replacing the slot
+_WRITING = -1
+
+
+def load_callable(spec):
+    """Function from a 'module:function' string, or spec itself if it already is one."""
+    if not isinstance(spec, str):
+        return spec
+    module_name, func_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+class SharedFrameRing:
+    """Fixed slots of frames in one multiprocessing.shared_memory block.
+
+    Frame seq n lives in slot n % slots. A reader takes a view with
+    view(seq) and checks valid(seq) once it is done with it; the writer
+    may have lapped it in between, the same seqlock idea as FrameRing.
+    spec is a small picklable tuple to attach() from another process.
+    """
+    def __init__(self, slots=8, frame_bytes=1920 * 1080 * 3, name=None):
+        self.slots = slots
+        self.frame_bytes = frame_bytes
+        header_bytes = slots * len(HEADER_FIELDS) * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.header = np.ndarray((slots, len(HEADER_FIELDS)), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((slots, frame_bytes), dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes)
+        if name is None:
+            self.header[:] = 0
+
+    @property
+    def spec(self):
+        return self.slots, self.frame_bytes, self.shm.name
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(*spec)
+
+    def write(self, seq, frame, pts=None, capture_time=0):
+        if frame.dtype != np.uint8 or frame.size > self.frame_bytes:
+            raise ValueError(f"frame {frame.shape} {frame.dtype} does not fit a {self.frame_bytes} byte slot")
+        slot = seq % self.slots
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        header = self.header[slot]
+        header[0] = _WRITING
+        # copies straight from a strided (e.g. mapped, padded) source into the slot
+        np.copyto(self.data[slot, :frame.size].reshape(frame.shape), frame)
+        header[1:] = (height, width, channels, -1 if pts is None else pts, capture_time)
+        header[0] = seq
+        return slot
+
+    def view(self, seq):
+        """(H, W, C) or (H, W) view of frame seq, None if the slot already holds another frame."""
+        header = self.header[seq % self.slots]
+        if header[0] != seq:
+            return None
+        height, width, channels = (int(value) for value in header[1:4])
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        return self.data[seq % self.slots, :height * width * channels].reshape(shape)
+
+    def valid(self, seq):
+        return self.header[seq % self.slots, 0] == seq
+
+    def close(self, unlink=False):
+        # views on shm.buf must be gone before it can be closed
+        del self.header, self.data
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def capture_main(source, transform, name, ring_spec, tasks, stop, failed, stats, gate=None):
+    """Capture process: decode source and hand frames to the workers.
+
+    Its metrics for stream name (decoded frames, reconnects, source up,
+    change gate) are sent to the serving process over stats every second.
+    """
+    import metrics
+    from gst_rtsp_server import Gst, Video_Buffer
+    Gst.init(None)
+
+    ring = SharedFrameRing.attach(ring_spec)
+    if gate is not None:
+        metrics.FRAMES_UNCHANGED.track(lambda: gate.skipped, stream=name)
+
+    def on_frame(frame, meta):
+        if frame.nbytes > ring.frame_bytes:
+            # every following frame would fail the same way, stop and let ProcessRelay report it
+            if not stop.is_set():
+                print(f"{name}: {frame.shape[1]}x{frame.shape[0]} frames do not fit the {ring.frame_bytes} byte "
+                      "shared slots, raise the stream's worker_frame_size")
+                failed.set()
+                stop.set()
+            return
+        if gate is not None and not gate.check(frame, meta):
+            return
+        # workers busy: drop here, before the copy into shared memory
+        if tasks.full():
+            metrics.WORKER_DROPS.inc(stream=name, stage='capture')
+            return
+        ring.write(meta.seq, frame, meta.pts, meta.capture_time or 0)
+        try:
+            tasks.put_nowait((meta.seq, meta.pts, meta.capture_time))
+        except queue.Full:
+            metrics.WORKER_DROPS.inc(stream=name, stage='capture')
+
+    video_buffer = Video_Buffer(pipe=source, transform=transform, name=name, copy_mode='view')
+    video_buffer.add_frame_callback(on_frame)
+    while not stop.wait(1.0):
+        stats.put(metrics.REGISTRY.export(stream=name))
+    video_buffer.release()
+    stats.put(metrics.REGISTRY.export(stream=name))
+    dropped = metrics.WORKER_DROPS.values.get((name, 'capture'), 0)
+    print(f"{name}: capture stopped, {dropped} frames dropped for busy workers"
+          + (f", {gate.skipped} unchanged" if gate is not None else ''))
+    ring.close()
+
+
+def worker_main(hook, in_spec, out_spec, tasks, results):
+    """Worker process: posts (task, True) once hook(frame) is in frames_out, (task, False) if the frame was lost."""
+    hook = load_callable(hook)
+    frames_in = SharedFrameRing.attach(in_spec)
+    frames_out = SharedFrameRing.attach(out_spec)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, pts, capture_time = task
+        frame = frames_in.view(seq)
+        out = frame
+        if frame is not None and hook is not None:
+            out = hook(frame)
+        # lapped by the capture process while the hook was running
+        if out is None or not frames_in.valid(seq):
+            results.put((task, False))
+            continue
+        try:
+            frames_out.write(seq, out, pts, capture_time)
+        except ValueError as error:
+            print(f"hook output dropped: {error}")
+            results.put((task, False))
+            continue
+        results.put((task, True))
+    frames_in.close()
+    frames_out.close()
+
+
+class ProcessRelay:
+    """Runs capture and hook in other processes and publishes the results into frame_hub.
+
+    Stands in for Video_Buffer + make_relay in GstServer.add_stream. hook
+    must be picklable: a 'module:function' string or a module level
+    function. It gets a view into shared memory and must not keep it.
+    A gst_frame.ChangeGate given as gate runs in the capture process.
+    The capture process' metrics for the stream are forwarded into this
+    process' metrics registry. dropped counts results lost or out of
+    order here.
+
+    Shared slots hold frames of up to frame_bytes (BGR at the source's
+    native size); larger frames stop the relay with an error on the first
+    one. failed is set once that happened.
+    """
+    def __init__(self, source, hook, frame_hub, transform='', name=None, workers=2,
+                 frame_bytes=1920 * 1080 * 3, gate=None):
+        self.name = name or source
+        self.frame_hub = frame_hub
+        self.dropped = 0
+        self.last_seq = 0
+        self.failed = False
+        # sized on the first result, see _pool_for()
+        self.pool = None
+
+        # slots > frames queued + frames in the workers' hands
+        slots = 4 * workers + 4
+        self.frames_in = SharedFrameRing(slots, frame_bytes)
+        self.frames_out = SharedFrameRing(slots, frame_bytes)
+
+        context = mp.get_context('spawn')
+        self.tasks = context.Queue(maxsize=2 * workers)
+        self.results = context.Queue()
+        self.stats = context.Queue()
+        self.stop_event = context.Event()
+        self.failed_event = context.Event()
+        self.capture = context.Process(
+            target=capture_main, name=f'capture {self.name}', daemon=True,
+            args=(source, transform, self.name, self.frames_in.spec, self.tasks, self.stop_event,
+                  self.failed_event, self.stats, gate))
+        self.workers = [context.Process(
+            target=worker_main, name=f'worker {self.name} {i}', daemon=True,
+            args=(hook, self.frames_in.spec, self.frames_out.spec, self.tasks, self.results))
+            for i in range(workers)]
+        for process in [self.capture] + self.workers:
+            process.start()
+
+        self.running = True
+        self.collector = threading.Thread(target=self.collect, name=f'collect {self.name}', daemon=True)
+        self.collector.start()
+
+    def _pool_for(self, nbytes):
+        """FramePool with one frame more than the hub can hold within its byte budget, plus one in flight."""
+        from gst_frame import FramePool
+        held = self.frame_hub.capacity
+        if self.frame_hub.max_bytes is not None:
+            held = min(held, self.frame_hub.max_bytes // max(nbytes, 1) + 1)
+        if self.pool is None or self.pool.size != held + 2:
+            self.pool = FramePool(held + 2)
+        return self.pool
+
+    def forward_stats(self):
+        while True:
+            try:
+                metrics.REGISTRY.restore(self.stats.get_nowait())
+            except queue.Empty:
+                return
+
+    def collect(self):
+        from gst_frame import FrameMeta
+        while self.running:
+            self.forward_stats()
+            try:
+                (seq, pts, capture_time), ok = self.results.get(timeout=0.5)
+            except queue.Empty:
+                if self.failed_event.is_set() and not self.failed:
+                    self.failed = True
+                    print(f"{self.name}: capture process stopped, see the error above")
+                continue
+            # workers finish out of order, never publish a frame older than the last one
+            if not ok or seq <= self.last_seq:
+                self.dropped += 1
+                continue
+            view = self.frames_out.view(seq)
+            frame = self._pool_for(view.nbytes).copy(view) if view is not None else None
+            if frame is None or not self.frames_out.valid(seq):
+                self.dropped += 1
+                continue
+            self.last_seq = seq
+            meta = FrameMeta(seq, pts, capture_time=capture_time)
+            meta.mark('queued')
+            self.frame_hub.publish(frame, meta)
+
+    def release(self):
+        self.running = False
+        self.stop_event.set()
+        for _ in self.workers:
+            try:
+                self.tasks.put(None, timeout=1)
+            except queue.Full:
+                break
+        for process in [self.capture] + self.workers:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.collector.join(timeout=1)
+        self.forward_stats()
+        self.frames_in.close(unlink=True)
+        self.frames_out.close(unlink=True)
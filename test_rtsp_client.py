@@ -1,17 +1,29 @@
-import numpy as np
+import asyncio
+import threading
 
 import gi
 
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 
+from gst_frame import FramePool, sample_meta, sample_to_array
+from frame_buffer import AsyncFrameStream
+from reconnect import SourceSupervisor
+
 
 
 class Video_Buffer():
-    def __init__(self, camera_name = "video1", appsink_name = "camera1"):
+    def __init__(self, camera_name = "video1", appsink_name = "camera1", copy_mode = 'dup', pool_size = 4,
+                 stale_after=5.0):
         Gst.init(None)
 
         self._frame = None
+        self._meta = None
+        self.frame_seq = 0
+        self.frame_callbacks = []
+        self._callbacks_lock = threading.Lock()
+        self.copy_mode = copy_mode
+        self.frame_pool = FramePool(pool_size) if copy_mode == 'pool' else None
         self.video_source = 'rtspsrc location=rtsp://127.0.0.1:8554/stream latency=10'
 
         self.video_codec = '! application/x-rtp, encoding-name=(string)H264, payload=96 ! rtph264depay ! h264parse '
@@ -23,9 +35,18 @@ class Video_Buffer():
         self.video_pipe = None
         self.video_sink = None
         self.appsink_name = appsink_name
+        self.name = camera_name
+        self.stale_after = stale_after
+        self.supervisor = None
 
         self.run()
 
+    def attach_sink(self, pipeline):
+        # called by the supervisor after every (re)build of the pipeline
+        self.video_pipe = pipeline
+        self.video_sink = pipeline.get_by_name(self.appsink_name)
+        self.video_sink.connect('new-sample', self.callback)
+
     def start_gst(self, config=None):
         if not config:
             config = \
@@ -41,23 +62,16 @@ class Video_Buffer():
         self.video_sink = self.video_pipe.get_by_name(self.appsink_name)
 
     @staticmethod
-    def gst_to_opencv(sample):
+    def gst_to_opencv(sample, copy_mode='dup', frame_pool=None):
         """Transform byte array into np array
         Args:
-            sample (TYPE): Description
+            sample (Gst.Sample): BGR sample pulled from the appsink
+            copy_mode (str): 'dup', 'pool' or 'view', see gst_frame
+            frame_pool (FramePool): recycled frames used by 'pool' mode
         Returns:
-            TYPE: Description
+            np.ndarray: (H, W, 3) uint8 frame
         """
-        buf = sample.get_buffer()
-        caps = sample.get_caps()
-        array = np.ndarray(
-            (
-                caps.get_structure(0).get_value('height'),
-                caps.get_structure(0).get_value('width'),
-                3
-            ),
-            buffer=buf.extract_dup(0, buf.get_size()), dtype=np.uint8)
-        return array
+        return sample_to_array(sample, copy_mode, frame_pool)
 
     def get_frame(self):
         """ Get Frame
@@ -74,65 +88,105 @@ class Video_Buffer():
         """
         return type(self._frame) != type(None)
 
+    def get_meta(self):
+        """Get the timing of the current frame
+        Returns:
+            FrameMeta: seq, pts and capture_time of get_frame()'s frame
+        """
+        return self._meta
+
+    def add_frame_callback(self, func):
+        """Call func(frame, meta) for every decoded frame, on the streaming thread"""
+        with self._callbacks_lock:
+            self.frame_callbacks = self.frame_callbacks + [func]
+
+    def remove_frame_callback(self, func):
+        with self._callbacks_lock:
+            self.frame_callbacks = [f for f in self.frame_callbacks if f is not func]
+
+    async def frames(self, policy='latest', maxsize=8, timeout=None):
+        """Iterate frames on an asyncio event loop
+        Args:
+            policy (str): 'latest', 'bounded' or 'block', see frame_buffer.AsyncFrameStream
+            maxsize (int): frames buffered by 'bounded' and 'block'
+            timeout (float): raise asyncio.TimeoutError after this many seconds without a frame
+        Yields:
+            tuple: (np.ndarray frame, FrameMeta)
+        """
+        stream = AsyncFrameStream(policy, maxsize)
+        self.add_frame_callback(stream.push)
+        try:
+            while True:
+                try:
+                    yield await stream.get(timeout)
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.remove_frame_callback(stream.push)
+            stream.close()
+
     def run(self):
         try:
             """ Get frame to update _frame
             """
-
-            self.start_gst(
-                [
-                    self.video_source,
-                    self.video_codec,
-                    self.video_decode,
-                    self.video_sink_conf
-                ])
-
-            self.video_sink.connect('new-sample', self.callback)
-
-            bus = self.video_pipe.get_bus()
-            bus.add_signal_watch()
-            bus.connect("message", self.on_message)
+            command = ' '.join([
+                self.video_source,
+                self.video_codec,
+                self.video_decode,
+                self.video_sink_conf
+            ])
+            # tears down and rebuilds the pipeline on ERROR / EOS / stale source, with backoff
+            self.supervisor = SourceSupervisor(command, self.attach_sink, self.name,
+                                               stale_after=self.stale_after, on_stale=self.on_stale)
+            self.supervisor.start()
         except Exception as e :
             print(e)
             pass
 
-    def on_message(self, bus, message):
-        t = message.type
-        if t == Gst.MessageType.ERROR or t == Gst.MessageType.EOS:
-            self.video_pipe.set_state(Gst.State.NULL)
-            self.run()
+    def on_stale(self):
+        self._frame = None
+        self._meta = None
 
     def callback(self, sink):
+        self.supervisor.frame_arrived()
         sample = sink.emit('pull-sample')
-        new_frame = self.gst_to_opencv(sample)
+        meta = sample_meta(sample, self.frame_seq + 1)
+        new_frame = self.gst_to_opencv(sample, self.copy_mode, self.frame_pool)
         self._frame = new_frame
+        self._meta = meta
+        self.frame_seq = meta.seq
+
+        for func in self.frame_callbacks:
+            func(new_frame, meta)
 
         return Gst.FlowReturn.OK
     
     def stop(self):
         """Stop the pipeline"""
-        self.video_pipe.set_state(Gst.State.NULL)
+        if self.supervisor is not None:
+            self.supervisor.stop()
 
     def get_pipeline_state(self):
+        if self.video_pipe is None:
+            return 'null'
         state = self.video_pipe.get_state(1 * Gst.SECOND)
         return state.state.value_nick
     
-if __name__ == '__main__':
-    import time
+async def main():
+    import cv2
 
     video = Video_Buffer()
+    async for frames, meta in video.frames(policy='latest'):
+        cv2.imshow('Combined Frame', frames)
 
-    time.sleep(1)
-    import cv2
-
-    while True:
-        if video.frame_available():
-            frames = video.get_frame()
+        if cv2.waitKey(1) & 0xFF == 27:
+            break
+    video.stop()
 
 
-            cv2.imshow('Combined Frame', frames)
+if __name__ == '__main__':
+    import cv2
 
-            if cv2.waitKey(1) & 0xFF == 27:
-                break
+    asyncio.run(main())
 
-    cv2.destroyAllWindows()
\ No newline at end of file
+    cv2.destroyAllWindows()
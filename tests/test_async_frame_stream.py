@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import pytest
+
+from frame_buffer import AsyncFrameStream
+
+
+def run(coroutine):
+    return asyncio.run(coroutine())
+
+
+def test_latest_keeps_newest():
+    async def main():
+        stream = AsyncFrameStream('latest')
+        for i in range(3):
+            stream.push(i, {'seq': i})
+        assert await stream.get() == (2, {'seq': 2})
+        assert stream.dropped == 2
+    run(main)
+
+
+def test_bounded_drops_oldest():
+    async def main():
+        stream = AsyncFrameStream('bounded', maxsize=2)
+        for i in range(4):
+            stream.push(i)
+        assert [(await stream.get())[0] for _ in range(2)] == [2, 3]
+        assert stream.dropped == 2
+    run(main)
+
+
+def test_block_waits_for_consumer():
+    async def main():
+        stream = AsyncFrameStream('block', maxsize=1)
+        producer = threading.Thread(target=lambda: [stream.push(i) for i in range(5)])
+        producer.start()
+        frames = [(await stream.get(timeout=5))[0] for _ in range(5)]
+        producer.join(timeout=5)
+        assert frames == [0, 1, 2, 3, 4]
+        assert stream.dropped == 0
+    run(main)
+
+
+def test_wakes_consumer_from_another_thread():
+    async def main():
+        stream = AsyncFrameStream('latest')
+        threading.Timer(0.05, stream.push, args=('frame',)).start()
+        assert await stream.get(timeout=5) == ('frame', None)
+    run(main)
+
+
+def test_close_ends_iteration_after_pending_frames():
+    async def main():
+        stream = AsyncFrameStream('bounded', maxsize=4)
+        stream.push(1)
+        stream.close()
+        stream.push(2)
+        return [frame async for frame, meta in stream]
+    assert run(main) == [1]
+
+
+def test_get_times_out():
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await AsyncFrameStream().get(timeout=0.01)
+    run(main)
+
+
+def test_unknown_policy():
+    async def main():
+        with pytest.raises(ValueError):
+            AsyncFrameStream('newest')
+    run(main)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+    gi.require_version('GstVideo', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+from gst_frame import ChangeGate, FrameMeta
+
+SECOND = 10 ** 9
+
+
+def meta(seconds):
+    return FrameMeta(1, int(seconds * SECOND))
+
+
+def test_static_scene_is_decimated():
+    gate = ChangeGate(threshold=2.0, static_fps=2, hold=0)
+    still = np.zeros((64, 64, 3), dtype=np.uint8)
+    passed = [gate.check(still, meta(i / 30)) for i in range(30)]
+    # 0 s and 0.5 s
+    assert sum(passed) == 2
+    assert gate.skipped == 28
+
+
+def test_change_passes_and_holds_full_rate():
+    gate = ChangeGate(threshold=2.0, static_fps=2, hold=1.0)
+    still = np.zeros((64, 64, 3), dtype=np.uint8)
+    moved = np.full((64, 64, 3), 50, dtype=np.uint8)
+    assert gate.check(still, meta(0))
+    assert gate.check(moved, meta(0.1))
+    assert gate.check(moved, meta(0.2))
+    # hold is over, back to static_fps
+    assert gate.check(moved, meta(1.2))
+    assert not gate.check(moved, meta(1.3))
+
+
+def test_planar_frames_use_luma():
+    gate = ChangeGate(static_fps=2, hold=0)
+    planes = (np.zeros((64, 64), dtype=np.uint8), np.zeros((32, 32, 2), dtype=np.uint8))
+    assert gate.check(planes, meta(0))
+    assert not gate.check(planes, meta(0.1))
+
+
+def test_static_fps_below_two_rejected():
+    with pytest.raises(ValueError):
+        ChangeGate(static_fps=1)
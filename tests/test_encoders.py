@@ -0,0 +1,58 @@
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+    gi.require_version('GstVideo', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+import encoders
+from encoders import ENCODERS, encode_launch, select_encoder
+
+
+@pytest.fixture
+def available(monkeypatch):
+    """Encoders that probe as working, instead of asking this host."""
+    names = set()
+    monkeypatch.setattr(encoders, 'probe_encoder', lambda name: name in names)
+    return names
+
+
+def test_encode_launch_x264():
+    assert encode_launch(ENCODERS['x264enc'], bitrate=2048, gop=60, profile='baseline', raw_format='BGR') == (
+        '! videoconvert ! video/x-raw,format=I420 '
+        '! videoscale name=scaler ! capsfilter name=scalecaps caps=video/x-raw '
+        '! x264enc name=encoder speed-preset=ultrafast tune=zerolatency bitrate=2048 key-int-max=60 '
+        '! video/x-h264,profile=baseline '
+        '! rtph264pay config-interval=1 name=pay0 pt=96')
+
+
+def test_encode_launch_maps_properties_and_skips_convert():
+    launch = encode_launch(ENCODERS['mpph265enc'], bitrate=2048, gop=30, raw_format='NV12')
+    assert launch.startswith('! videoscale name=scaler ')
+    assert 'mpph265enc name=encoder bps=2048000 gop=30 ' in launch
+    assert launch.endswith('! rtph265pay config-interval=1 name=pay0 pt=96')
+
+
+def test_select_encoder_follows_priority(available):
+    available.update({'x264enc', 'nvh264enc', 'x265enc'})
+    assert select_encoder('h264').element == 'nvh264enc'
+    assert select_encoder('h265').element == 'x265enc'
+    assert select_encoder('h264', priority=('x264enc', 'nvh264enc')).element == 'x264enc'
+
+
+def test_select_encoder_by_name(available):
+    available.add('openh264enc')
+    assert select_encoder('h264', 'openh264enc').element == 'openh264enc'
+    with pytest.raises(RuntimeError):
+        select_encoder('h264', 'x264enc')
+    with pytest.raises(ValueError):
+        select_encoder('h264', 'fooenc')
+
+
+def test_select_encoder_none_available(available):
+    with pytest.raises(RuntimeError, match='No h265 encoder'):
+        select_encoder('h265')
+    with pytest.raises(ValueError):
+        select_encoder('vp8')
@@ -0,0 +1,175 @@
+import queue
+
+import numpy as np
+import pytest
+
+from frame_buffer import FrameHub, FrameRing, frame_nbytes
+
+
+def test_hub_subscribers_each_get_every_frame():
+    hub = FrameHub(8)
+    first, second = hub.subscribe(), hub.subscribe()
+    for i in range(3):
+        hub.publish(i)
+    assert [first.get_nowait() for _ in range(3)] == [0, 1, 2]
+    assert [second.get_nowait() for _ in range(3)] == [0, 1, 2]
+
+
+def test_hub_subscription_starts_at_next_frame():
+    hub = FrameHub(8)
+    hub.publish('old')
+    subscription = hub.subscribe()
+    hub.publish('new')
+    assert subscription.get_nowait() == 'new'
+
+
+def test_hub_slow_subscriber_counts_drops():
+    hub = FrameHub(4)
+    subscription = hub.subscribe()
+    for i in range(10):
+        hub.publish(i)
+    assert subscription.get_nowait() == 7
+    assert subscription.dropped == 7
+    subscription.close()
+    assert hub.dropped_total() == 7
+
+
+def test_ring_reads_in_order():
+    ring = FrameRing(4)
+    for i in range(3):
+        ring.put(i)
+    assert [ring.get_nowait() for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(queue.Empty):
+        ring.get_nowait()
+
+
+def test_ring_drops_oldest_when_lapped():
+    ring = FrameRing(3)
+    for i in range(5):
+        ring.put(i)
+    assert ring.overwrites == 3
+    assert ring.get_nowait() == 3
+    assert ring.drops == 3
+    assert ring.qsize() == 1
+
+
+def test_ring_latest_skips_to_newest():
+    ring = FrameRing(8)
+    for i in range(5):
+        ring.put(i)
+    assert ring.get_nowait(latest=True) == 4
+
+
+def test_ring_get_times_out():
+    with pytest.raises(queue.Empty):
+        FrameRing(4).get(timeout=0.01)
+
+
+def test_ring_needs_two_slots():
+    with pytest.raises(ValueError):
+        FrameRing(1)
+
+
+def test_hub_from_keyframe_starts_on_cached_gop():
+    hub = FrameHub(8)
+    hub.publish('p0')
+    hub.publish('i1', keyframe=True)
+    hub.publish('p1')
+    subscription = hub.subscribe(from_keyframe=True)
+    assert [subscription.get_nowait() for _ in range(2)] == ['i1', 'p1']
+    assert hub.subscribe().qsize() == 0
+
+
+def test_hub_from_keyframe_ignores_released_keyframe():
+    hub = FrameHub(4)
+    hub.publish('i0', keyframe=True)
+    for i in range(4):
+        hub.publish(i)
+    subscription = hub.subscribe(from_keyframe=True)
+    with pytest.raises(queue.Empty):
+        subscription.get_nowait()
+
+
+def test_notify_wakes_starved_subscriber_once():
+    hub = FrameHub(4)
+    subscription = hub.subscribe()
+    calls = []
+    subscription.notify(lambda: calls.append('woken'))
+    hub.publish(1)
+    hub.publish(2)
+    assert calls == ['woken']
+
+
+def test_notify_with_pending_frame_calls_right_away():
+    hub = FrameHub(4)
+    subscription = hub.subscribe()
+    hub.publish(1)
+    calls = []
+    subscription.notify(lambda: calls.append('woken'))
+    assert calls == ['woken']
+
+
+def test_notify_after_close_is_ignored():
+    hub = FrameHub(4)
+    subscription = hub.subscribe()
+    subscription.close()
+    calls = []
+    subscription.notify(lambda: calls.append('woken'))
+    hub.publish(1)
+    assert calls == []
+
+
+def frame(nbytes=100):
+    return np.zeros(nbytes, dtype=np.uint8)
+
+
+def test_frame_nbytes_of_planes():
+    assert frame_nbytes((frame(8), frame(4))) == 12
+
+
+def test_hub_budget_first_publish_evicts_nothing():
+    hub = FrameHub(8, max_bytes=50, max_age=10)
+    hub.publish(frame(100))
+    assert hub.evictions == 0
+    assert hub.bytes == 100
+
+
+def test_hub_byte_budget_keeps_newest():
+    hub = FrameHub(8, max_bytes=250)
+    subscription = hub.subscribe()
+    for _ in range(5):
+        hub.publish(frame(100))
+    assert hub.bytes == 200
+    assert hub.evictions == 3
+    assert subscription.qsize() == 2
+    subscription.get_nowait()
+    assert subscription.dropped == 3
+
+
+def test_hub_age_budget(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('frame_buffer.time.monotonic', lambda: now[0])
+    hub = FrameHub(8, max_age=1.0)
+    hub.publish(frame())
+    now[0] += 0.5
+    hub.publish(frame())
+    assert hub.evictions == 0
+    now[0] += 2.0
+    hub.publish(frame())
+    assert hub.evictions == 2
+    assert hub.bytes == 100
+
+
+def test_stalled_source_frames_expire_on_read(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('frame_buffer.time.monotonic', lambda: now[0])
+    hub = FrameHub(8, max_age=1.0)
+    subscription = hub.subscribe()
+    hub.publish(1)
+    hub.publish(2)
+    now[0] += 2.0
+    with pytest.raises(queue.Empty):
+        subscription.get_nowait()
+    assert subscription.dropped == 2
+    hub.publish(3)
+    assert subscription.get_nowait() == 3
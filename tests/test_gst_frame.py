@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+    gi.require_version('GstVideo', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+from gi.repository import Gst
+
+from gst_frame import (DecodeSampler, FrameMeta, FramePool, SourceClock, caps_layout, frame_caps,
+                       sample_to_array)
+
+Gst.init(None)
+
+MS = Gst.SECOND // 1000
+
+
+def stamp(clock, pts, duration=None):
+    return clock.stamp(Gst.Buffer.new(), FrameMeta(pts=pts, duration=duration)).pts
+
+
+def test_clock_starts_at_zero_and_follows_source():
+    clock = SourceClock(33 * MS)
+    assert [stamp(clock, pts) for pts in (5000 * MS, 5040 * MS, 5073 * MS)] == [0, 40 * MS, 73 * MS]
+
+
+def test_clock_rebases_when_source_goes_backwards():
+    clock = SourceClock(33 * MS)
+    stamp(clock, 5000 * MS)
+    stamp(clock, 5040 * MS)
+    # reconnect, the source restarts its timeline
+    assert stamp(clock, 10 * MS) == 73 * MS
+    assert stamp(clock, 50 * MS) == 113 * MS
+
+
+def test_clock_rebases_on_gap_over_max_gap():
+    clock = SourceClock(33 * MS, max_gap=Gst.SECOND)
+    stamp(clock, 0)
+    assert stamp(clock, 900 * MS) == 900 * MS
+    assert stamp(clock, 5000 * MS) == 933 * MS
+
+
+def test_clock_counts_frames_without_source_pts():
+    clock = SourceClock(33 * MS)
+    buffers = [clock.stamp(Gst.Buffer.new()) for _ in range(3)]
+    assert [buf.pts for buf in buffers] == [0, 33 * MS, 66 * MS]
+    assert [buf.offset for buf in buffers] == [0, 1, 2]
+
+
+def raw_sample(pixel_format, width, height, data):
+    caps = Gst.Caps.from_string(f'video/x-raw,format={pixel_format},width={width},height={height},framerate=30/1')
+    return Gst.Sample.new(Gst.Buffer.new_wrapped(data.tobytes()), caps, None, None)
+
+
+def test_caps_layout_pads_rows_to_four_bytes():
+    caps = Gst.Caps.from_string('video/x-raw,format=BGR,width=6,height=4,framerate=30/1')
+    assert caps_layout(caps) == ('BGR', [(0, (4, 6, 3), (20, 3, 1))], 80)
+
+
+def test_caps_layout_planar():
+    i420 = Gst.Caps.from_string('video/x-raw,format=I420,width=6,height=4,framerate=30/1')
+    assert caps_layout(i420) == ('I420', [(0, (4, 6), (8, 1)), (32, (2, 3), (4, 1)), (40, (2, 3), (4, 1))], 48)
+    nv12 = Gst.Caps.from_string('video/x-raw,format=NV12,width=6,height=4,framerate=30/1')
+    assert caps_layout(nv12) == ('NV12', [(0, (4, 6), (8, 1)), (32, (2, 3, 2), (8, 2, 1))], 48)
+
+
+@pytest.mark.parametrize('mode', ['dup', 'pool', 'view'])
+def test_sample_to_array_skips_row_padding(mode):
+    data = np.arange(80, dtype=np.uint8)
+    expected = np.lib.stride_tricks.as_strided(data, (4, 6, 3), (20, 3, 1))
+    frame = sample_to_array(raw_sample('BGR', 6, 4, data), mode, FramePool(2))
+    assert frame.shape == (4, 6, 3)
+    np.testing.assert_array_equal(frame, expected)
+
+
+@pytest.mark.parametrize('mode', ['dup', 'pool', 'view'])
+def test_sample_to_array_i420_planes(mode):
+    data = np.arange(48, dtype=np.uint8)
+    y, u, v = sample_to_array(raw_sample('I420', 6, 4, data), mode, FramePool(2))
+    np.testing.assert_array_equal(y, data[:32].reshape(4, 8)[:, :6])
+    np.testing.assert_array_equal(u, data[32:40].reshape(2, 4)[:, :3])
+    np.testing.assert_array_equal(v, data[40:].reshape(2, 4)[:, :3])
+
+
+def test_sample_to_array_pool_mode_needs_pool():
+    with pytest.raises(ValueError):
+        sample_to_array(raw_sample('GRAY8', 4, 2, np.zeros(8, dtype=np.uint8)), 'pool')
+
+
+def test_frame_caps_follow_frame():
+    assert frame_caps(np.zeros((4, 6, 3), np.uint8)).to_string() == \
+        'video/x-raw, format=(string)BGR, width=(int)6, height=(int)4, framerate=(fraction)30/1'
+    planes = (np.zeros((4, 6), np.uint8), np.zeros((2, 3, 2), np.uint8))
+    assert frame_caps(planes).get_structure(0).get_value('format') == 'NV12'
+
+
+class ProbeInfo:
+    def __init__(self, pts=Gst.CLOCK_TIME_NONE, delta=False):
+        self.buffer = Gst.Buffer.new()
+        self.buffer.pts = pts
+        if delta:
+            self.buffer.set_flags(Gst.BufferFlags.DELTA_UNIT)
+
+    def get_buffer(self):
+        return self.buffer
+
+
+def test_sampler_inactive_by_default():
+    assert not DecodeSampler().active
+    assert DecodeSampler(stride=2).active
+
+
+def test_sampler_keyframes_only_drops_delta_units():
+    sampler = DecodeSampler(keyframes_only=True)
+    assert sampler.on_encoded(None, ProbeInfo()) == Gst.PadProbeReturn.OK
+    assert sampler.on_encoded(None, ProbeInfo(delta=True)) == Gst.PadProbeReturn.DROP
+    assert sampler.dropped_encoded == 1
+
+
+def test_sampler_stride_keeps_every_nth():
+    sampler = DecodeSampler(stride=3)
+    kept = [i for i in range(1, 10) if sampler.on_decoded(None, ProbeInfo(i * 33 * MS)) == Gst.PadProbeReturn.OK]
+    assert kept == [3, 6, 9]
+    assert sampler.dropped_decoded == 6
+
+
+def test_sampler_target_fps_uses_pts():
+    sampler = DecodeSampler(target_fps=10)
+    kept = [i for i in range(40) if sampler.on_decoded(None, ProbeInfo(i * 25 * MS)) == Gst.PadProbeReturn.OK]
+    assert kept == list(range(0, 40, 4))
+    assert sampler.dropped_decoded == 30
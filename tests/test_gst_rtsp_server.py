@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+    gi.require_version('GstRtspServer', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+from gst_rtsp_server import build_transform_chain, load_stream_config, mosaic_layout, placeholder_tile
+
+
+def write_config(tmp_path, streams):
+    path = tmp_path / 'streams.json'
+    path.write_text(json.dumps(streams))
+    return str(path)
+
+
+def test_transform_chain_empty():
+    assert build_transform_chain() == ''
+
+
+def test_transform_chain_order():
+    chain = build_transform_chain(rotate=90, flip='horizontal', crop=(1, 2, 3, 4), scale=(640, 360), max_fps=10,
+                                  colorspace='GRAY8')
+    assert chain == ('! videocrop top=1 bottom=2 left=3 right=4 '
+                     '! videoflip method=clockwise '
+                     '! videoflip method=horizontal-flip '
+                     '! videoscale ! video/x-raw,width=640,height=360 '
+                     '! videorate drop-only=true ! video/x-raw,framerate=10/1 '
+                     '! videoconvert ! video/x-raw,format=GRAY8 ')
+
+
+def test_config_rejects_bad_rotate(tmp_path):
+    path = write_config(tmp_path, [{'mount': '/a', 'source': 'rtsp://cam', 'rotate': 45}])
+    with pytest.raises(ValueError, match='rotate'):
+        load_stream_config(path)
+
+
+def test_config_rejects_bad_flip(tmp_path):
+    path = write_config(tmp_path, [{'mount': '/a', 'source': 'rtsp://cam', 'flip': 'diagonal'}])
+    with pytest.raises(ValueError, match='flip'):
+        load_stream_config(path)
+
+
+def test_config_list_or_streams_key(tmp_path):
+    streams = [{'mount': '/a', 'source': 'rtsp://cam-a'}, {'mount': '/b', 'source': 'rtsp://cam-b', 'rotate': 90}]
+    assert load_stream_config(write_config(tmp_path, streams)) == streams
+    assert load_stream_config(write_config(tmp_path, {'streams': streams})) == streams
+
+
+def test_config_needs_mount_and_source(tmp_path):
+    path = write_config(tmp_path, [{'mount': '/a'}])
+    with pytest.raises(ValueError, match='source'):
+        load_stream_config(path)
+
+
+def test_config_rejects_unknown_options(tmp_path):
+    path = write_config(tmp_path, [{'mount': '/a', 'source': 'rtsp://cam', 'rotation': 90}])
+    with pytest.raises(ValueError, match='rotation'):
+        load_stream_config(path)
+
+
+def test_example_config_loads():
+    assert load_stream_config(os.path.join(os.path.dirname(__file__), '..', 'streams.example.json'))
+
+
+def test_mosaic_layout():
+    assert mosaic_layout(1, 1920, 1080) == (1, 1, 1920, 1080)
+    assert mosaic_layout(4, 1920, 1080) == (2, 2, 960, 540)
+    assert mosaic_layout(5, 1920, 1080) == (3, 2, 640, 540)
+
+
+def test_mosaic_tiles_are_even():
+    columns, rows, width, height = mosaic_layout(3, 1280, 722)
+    assert (columns, rows) == (2, 2)
+    assert width % 2 == 0 and height % 2 == 0
+
+
+def test_placeholder_tile():
+    y, u, v = placeholder_tile(64, 36)
+    assert y.shape == (36, 64)
+    assert u.shape == v.shape == (18, 32)
+    assert (u == 128).all() and (v == 128).all()
+    assert set(y.flat) == {40, 120}
+    # both diagonals are drawn
+    assert y[0, 0] == y[0, 63] == y[35, 0] == y[35, 63] == 120
@@ -0,0 +1,68 @@
+from metrics import Registry
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    frames = registry.counter('frames_total', 'Frames', ['stream'])
+    depth = registry.gauge('depth', 'Depth')
+    frames.inc(stream='/a')
+    frames.inc(2, stream='/a')
+    depth.set(3)
+    assert registry.render() == (
+        '# HELP frames_total Frames\n'
+        '# TYPE frames_total counter\n'
+        'frames_total{stream="/a"} 3\n'
+        '# HELP depth Depth\n'
+        '# TYPE depth gauge\n'
+        'depth 3\n')
+
+
+def test_tracked_value_read_at_render():
+    registry = Registry()
+    gauge = registry.gauge('held', 'Held', ['stream'])
+    value = [1]
+    gauge.track(lambda: value[0], stream='/a')
+    value[0] = 5
+    assert 'held{stream="/a"} 5' in registry.render()
+    gauge.untrack(stream='/a')
+    assert 'held{' not in registry.render()
+
+
+def test_failing_tracker_is_skipped():
+    registry = Registry()
+    gauge = registry.gauge('held', 'Held')
+    gauge.track(lambda: 1 / 0)
+    assert registry.render() == '# HELP held Held\n# TYPE held gauge\n'
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage='encode')
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{stage="encode",le="0.1"} 1',
+        'latency_seconds_bucket{stage="encode",le="1.0"} 2',
+        'latency_seconds_bucket{stage="encode",le="+Inf"} 3',
+        'latency_seconds_sum{stage="encode"} 5.55',
+        'latency_seconds_count{stage="encode"} 3',
+    ]
+
+
+def test_export_restore_moves_one_stream():
+    child = Registry()
+    decoded = child.counter('decoded_total', 'Decoded', ['stream'])
+    unchanged = child.counter('unchanged_total', 'Unchanged', ['stream'])
+    decoded.inc(5, stream='/a')
+    decoded.inc(stream='/b')
+    unchanged.track(lambda: 3, stream='/a')
+
+    parent = Registry()
+    parent.counter('decoded_total', 'Decoded', ['stream'])
+    parent.counter('unchanged_total', 'Unchanged', ['stream'])
+    parent.restore(child.export(stream='/a'))
+    rendered = parent.render()
+    assert 'decoded_total{stream="/a"} 5' in rendered
+    assert 'unchanged_total{stream="/a"} 3' in rendered
+    assert '/b' not in rendered
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+import multi_stream
+from gst_frame import FrameMeta
+
+MS = 10 ** 6
+
+
+class FakeVideo:
+    """Stands in for gst_client.Video_Buffer, frames are delivered by the test."""
+    def __init__(self, **kwargs):
+        self.callbacks = []
+
+    def add_frame_callback(self, func):
+        self.callbacks.append(func)
+
+    def deliver(self, value, seq, capture_time, shape=(4, 6, 3)):
+        for func in self.callbacks:
+            func(np.full(shape, value, dtype=np.uint8), FrameMeta(seq, capture_time=capture_time))
+
+    def stop(self):
+        pass
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    monkeypatch.setattr(multi_stream, 'Video_Buffer', FakeVideo)
+    return multi_stream.MultiStreamReader(['cam0', 'cam1'], height=4, width=6, tolerance=0.05, buffers=1)
+
+
+def test_frames_within_tolerance_are_batched(reader):
+    now = time.time_ns()
+    reader.videos[0].deliver(10, 1, now - 10 * MS)
+    reader.videos[1].deliver(20, 1, now - 30 * MS)
+    batch = reader.read(timeout=0)
+    assert batch.ref_time == now - 10 * MS
+    assert batch.valid.tolist() == [True, True]
+    assert batch.frames[:, 0, 0, 0].tolist() == [10, 20]
+
+
+def test_closest_frame_of_history_is_picked(reader):
+    now = time.time_ns()
+    for seq, age in enumerate((120, 60, 0), 1):
+        reader.videos[0].deliver(seq, seq, now - age * MS)
+    reader.videos[1].deliver(50, 1, now - 200 * MS)
+    reader.videos[1].deliver(51, 2, now - 70 * MS)
+    batch = reader.read(timeout=0)
+    # cam1's newest frame is 70 ms off the reference, out of tolerance
+    assert batch.valid.tolist() == [True, False]
+    assert batch.seqs[0] == 3
+
+    reader.videos[1].deliver(52, 3, now - 20 * MS)
+    batch = reader.read(timeout=0)
+    assert batch.valid.tolist() == [True, True]
+    assert batch.seqs.tolist() == [3, 3]
+
+
+def test_stale_camera_does_not_set_reference(reader):
+    now = time.time_ns()
+    reader.videos[0].deliver(10, 1, now - 5000 * MS)
+    reader.videos[1].deliver(20, 1, now)
+    batch = reader.read(timeout=0)
+    assert batch.ref_time == now
+    assert batch.valid.tolist() == [False, True]
+
+
+def test_frame_of_other_size_is_invalid(reader):
+    now = time.time_ns()
+    reader.videos[0].deliver(10, 1, now, shape=(8, 6, 3))
+    reader.videos[1].deliver(20, 1, now)
+    assert reader.read(timeout=0).valid.tolist() == [False, True]
+
+
+def test_no_fresh_frames_gives_empty_batch(reader):
+    batch = reader.read(timeout=0)
+    assert batch.ref_time == 0
+    assert not batch.valid.any()
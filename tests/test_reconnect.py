@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+import metrics
+from reconnect import Backoff, SourceSupervisor
+
+
+def test_backoff_grows_to_maximum():
+    backoff = Backoff(initial=0.5, maximum=4.0, factor=2.0, jitter=0)
+    assert [backoff.next() for _ in range(6)] == [0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_backoff_reset():
+    backoff = Backoff(initial=0.5, jitter=0)
+    backoff.next()
+    backoff.next()
+    backoff.reset()
+    assert backoff.next() == 0.5
+
+
+def test_backoff_jitter_only_shortens():
+    backoff = Backoff(initial=1.0, factor=1.0, jitter=0.5)
+    delays = [backoff.next() for _ in range(100)]
+    assert all(0.5 <= delay <= 1.0 for delay in delays)
+
+
+def source_up(name):
+    return metrics.SOURCE_UP.values.get((name,))
+
+
+def test_supervisor_source_up_on_first_frame():
+    supervisor = SourceSupervisor('fakesrc ! fakesink', lambda pipeline: None, '/test/first')
+    assert source_up('/test/first') == 0
+    supervisor.frame_arrived()
+    assert supervisor.up
+    assert source_up('/test/first') == 1
+    supervisor.frame_arrived()
+    assert source_up('/test/first') == 1
+
+
+def test_supervisor_recovery_resets_backoff():
+    supervisor = SourceSupervisor('fakesrc ! fakesink', lambda pipeline: None, '/test/recovery')
+    supervisor.backoff.next()
+    supervisor.down_since = time.monotonic() - 2.0
+    supervisor.frame_arrived()
+    assert supervisor.down_since is None
+    assert supervisor.backoff.attempts == 0
+    assert source_up('/test/recovery') == 1
+    assert metrics.SOURCE_RECOVERY.values[('/test/recovery',)][2] == 1
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from shm_relay import SharedFrameRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing(slots=4, frame_bytes=6 * 4 * 3)
+    yield ring
+    ring.close(unlink=True)
+
+
+def test_write_and_view(ring):
+    frame = np.arange(72, dtype=np.uint8).reshape(4, 6, 3)
+    ring.write(1, frame, pts=40, capture_time=123)
+    view = ring.view(1)
+    np.testing.assert_array_equal(view, frame)
+    assert ring.header[1].tolist() == [1, 4, 6, 3, 40, 123]
+    assert ring.valid(1)
+
+
+def test_gray_frame_keeps_two_dimensions(ring):
+    ring.write(2, np.ones((3, 5), dtype=np.uint8))
+    assert ring.view(2).shape == (3, 5)
+
+
+def test_lapped_slot_is_reused(ring):
+    ring.write(1, np.zeros((4, 6, 3), dtype=np.uint8))
+    view = ring.view(1)
+    ring.write(5, np.full((4, 6, 3), 9, dtype=np.uint8))
+    # the reader's view now shows frame 5, valid() tells it so
+    assert not ring.valid(1)
+    assert ring.view(1) is None
+    assert view[0, 0, 0] == 9
+    del view
+
+
+def test_frame_too_large(ring):
+    with pytest.raises(ValueError):
+        ring.write(1, np.zeros((8, 6, 3), dtype=np.uint8))
+
+
+def test_attach_shares_the_frames(ring):
+    other = SharedFrameRing.attach(ring.spec)
+    try:
+        ring.write(3, np.full((2, 2), 7, dtype=np.uint8))
+        np.testing.assert_array_equal(other.view(3), np.full((2, 2), 7))
+    finally:
+        other.close()